@@ -0,0 +1,167 @@
+"""
+Shared CEDAR form completion rules for the MDS syncs.
+
+The MySQL sync (mds_data_sync/mds2mysql) scores completion from the
+flattened `cedar_study_metadata.<section>.<field>` columns of its gen3
+frame, and the MongoDB sync (mds_data_sync/mds2mongo) scores the raw
+`gen3_discovery.study_metadata` of each document. Both compile a CedarSchema
+from the fields present in the batch and evaluate the whole batch against
+it, so the two sinks report the same numbers for the same study:
+
+- every field of the nine CEDAR form sections seen anywhere in the batch
+  counts towards a study's total, whether or not the study has it;
+- the Metadata Location fields that are not on the form
+  (EXCLUDED_FIELDS) are left out;
+- a field is completed unless it is missing, None/NaN, "", "0", an empty
+  list, or a dict with no truthy values;
+- the percentage is rounded to one decimal place.
+
+Registration status is not part of the schema; each sink applies its own
+rule for zeroing unregistered studies.
+"""
+import numpy as np
+
+# Sections of the CEDAR form, in the order the form shows them
+CEDAR_SECTIONS = [
+    "minimal_info",
+    "metadata_location",
+    "data_availability",
+    "study_translational_focus",
+    "study_type",
+    "human_treatment_applicability",
+    "human_condition_applicability",
+    "human_subject_applicability",
+    "data",
+]
+
+# Fields in the Metadata Location section in the MDS that are not on the CEDAR form.
+# They are excluded to keep from confusing the PIs if the missing-field list is shared
+EXCLUDED_FIELDS = frozenset([
+    "metadata_location.data_repositories",
+    "metadata_location.nih_reporter_link",
+    "metadata_location.nih_application_id",
+    "metadata_location.clinical_trials_study_ID",
+    "metadata_location.cedar_study_level_metadata_template_instance_ID",
+])
+
+# Column prefix used by the flattened gen3 frame in the MySQL sync
+FRAME_PREFIX = "cedar_study_metadata."
+
+_SECTION_ORDER = {section: i for i, section in enumerate(CEDAR_SECTIONS)}
+
+
+def is_unfilled(value) -> bool:
+    """True if a CEDAR field value counts as not completed."""
+    if value is None or value == "" or value == "0":
+        return True
+    if isinstance(value, float):
+        return value != value  # NaN
+    if type(value) == list:
+        return len(value) == 0
+    if type(value) == dict:
+        return not any(value.values())
+    return False
+
+
+_is_unfilled = np.frompyfunc(is_unfilled, 1, 1)
+
+
+class CedarSchema:
+    """
+    Section -> field index and exclusion mask for one batch of studies.
+
+    Args:
+        fields: `section.field` names seen in the batch. Fields outside the
+                CEDAR sections and excluded fields are dropped; the rest are
+                ordered by section, then in the order given.
+    """
+
+    def __init__(self, fields):
+        kept = []
+        for name in dict.fromkeys(fields):
+            section = name.split(".", 1)[0]
+            if section in _SECTION_ORDER and name not in EXCLUDED_FIELDS:
+                kept.append(name)
+        self.fields = sorted(kept, key=lambda name: _SECTION_ORDER[name.split(".", 1)[0]])
+        self.index = {name: i for i, name in enumerate(self.fields)}
+        self.sections = {
+            section: [i for i, name in enumerate(self.fields) if name.split(".", 1)[0] == section]
+            for section in CEDAR_SECTIONS
+        }
+
+    @classmethod
+    def from_records(cls, records):
+        """Compile from MDS records (as returned by the MDS, without the GUID keys)."""
+        fields = {}
+        for record in records:
+            for section, values in _study_metadata(record).items():
+                if section in _SECTION_ORDER and isinstance(values, dict):
+                    for field in values:
+                        fields.setdefault(f"{section}.{field}")
+        return cls(fields)
+
+    @classmethod
+    def from_columns(cls, columns, prefix: str = FRAME_PREFIX):
+        """Compile from flattened frame columns named `<prefix><section>.<field>`."""
+        return cls(col[len(prefix):] for col in columns if isinstance(col, str) and col.startswith(prefix))
+
+    def evaluate_records(self, records) -> "CedarCompletion":
+        """Score a list of MDS records; studies without study_metadata score 0."""
+        filled = np.zeros((len(records), len(self.fields)), dtype=bool)
+        for row, record in enumerate(records):
+            for section, values in _study_metadata(record).items():
+                if section not in _SECTION_ORDER or not isinstance(values, dict):
+                    continue
+                for field, value in values.items():
+                    col = self.index.get(f"{section}.{field}")
+                    if col is not None and not is_unfilled(value):
+                        filled[row, col] = True
+        return CedarCompletion(self, filled)
+
+    def evaluate_frame(self, df, prefix: str = FRAME_PREFIX) -> "CedarCompletion":
+        """Score every row of a frame with flattened `<prefix><section>.<field>` columns."""
+        values = df[[prefix + name for name in self.fields]].to_numpy(dtype=object)
+        filled = ~_is_unfilled(values).astype(bool)
+        return CedarCompletion(self, filled)
+
+
+def _study_metadata(record: dict) -> dict:
+    gen3_discovery = record.get("gen3_discovery") or {}
+    study_metadata = gen3_discovery.get("study_metadata") if isinstance(gen3_discovery, dict) else None
+    return study_metadata if isinstance(study_metadata, dict) else {}
+
+
+class CedarCompletion:
+    """
+    Result of evaluating a batch against a CedarSchema: one row per study,
+    one column per schema field, True where the field is completed.
+    """
+
+    def __init__(self, schema: CedarSchema, filled: np.ndarray):
+        self.schema = schema
+        self.filled = filled
+
+    @property
+    def total(self) -> int:
+        return len(self.schema.fields)
+
+    @property
+    def completed(self) -> np.ndarray:
+        return self.filled.sum(axis=1)
+
+    @property
+    def percent(self) -> np.ndarray:
+        if not self.total:
+            return np.zeros(len(self.filled))
+        return np.round(100 * self.completed / self.total, 1)
+
+    def section_counts(self) -> dict:
+        """Section -> (completed per study, total fields in the section)."""
+        return {
+            section: (self.filled[:, cols].sum(axis=1), len(cols))
+            for section, cols in self.schema.sections.items()
+        }
+
+    def missing_fields(self, row: int) -> list:
+        """`section.field` names that study `row` has not completed."""
+        return [self.schema.fields[col] for col in np.flatnonzero(~self.filled[row])]
@@ -0,0 +1,71 @@
+"""
+SQLAlchemy engine for the HEAL MySQL database, shared by the Lambdas that
+read from and write to it (mds_data_sync/mds2mysql and reporter).
+
+get_engine() builds one engine per process from DB_USER, DB_PASSWORD, DB_HOST
+and DB_NAME and keeps it at module level, so warm invocations of a Lambda
+reuse its pooled connections instead of opening and authenticating new ones.
+Connections are pinged on checkout and replaced if the server has closed them
+while the container was frozen, and they are recycled after DB_POOL_RECYCLE
+seconds. The same engine is used for reads, DDL and bulk loads; it is created
+with local_infile enabled for `LOAD DATA LOCAL INFILE`.
+
+Environment variables:
+    DB_POOL_SIZE:    Connections kept open between invocations (default 2)
+    DB_POOL_RECYCLE: Seconds after which a connection is replaced (default 3600)
+"""
+import os
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+
+_engine = None
+_engine_url = None
+_lock = threading.Lock()
+
+
+def engine_url() -> URL:
+    """MySQL URL for the PyMySQL driver from the DB_* environment variables."""
+    return URL.create(
+        "mysql+pymysql",
+        username=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST'),
+        database=os.getenv('DB_NAME'),
+    )
+
+
+def get_engine():
+    """
+    The process-wide engine, created on first use.
+
+    If the DB_* variables have changed since it was created, the old engine
+    is disposed of and a new one is built.
+    """
+    global _engine, _engine_url
+    url = engine_url()
+    with _lock:
+        if _engine is None or url != _engine_url:
+            if _engine is not None:
+                _engine.dispose()
+            _engine = create_engine(
+                url,
+                pool_size=int(os.getenv('DB_POOL_SIZE', 2)),
+                max_overflow=2,
+                pool_pre_ping=True,
+                pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 3600)),
+                connect_args={'local_infile': True},
+            )
+            _engine_url = url
+        return _engine
+
+
+def dispose_engine():
+    """Close every pooled connection, e.g. at the end of a local run."""
+    global _engine, _engine_url
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _engine_url = None
@@ -0,0 +1,67 @@
+"""
+Pluggable JSON decoding for HTTP responses.
+
+orjson is used when it is installed and the standard library `json` module
+otherwise. Responses are requested with gzip (and brotli, when a brotli
+decoder is available to urllib3) transfer encoding, and read_json_response
+times the transfer and the decode separately so the two can be compared.
+"""
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli  # noqa: F401  (lets urllib3 decode Content-Encoding: br)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data):
+    """Decode JSON from bytes or str with the fastest available backend."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_json_response(response):
+    """
+    Read and decode the body of a `requests` response.
+
+    The response should have been requested with `stream=True`; the body is
+    then read here so that transfer time (including decompression) and
+    decode time are measured separately.
+
+    Returns:
+        Tuple of (decoded JSON, timings) where timings is a dict with
+        `wire_bytes` (bytes received, compressed), `bytes` (decompressed body),
+        `encoding` (Content-Encoding), `transfer` and `decode` (seconds).
+    """
+    start = time.perf_counter()
+    body = response.content
+    transferred = time.perf_counter()
+    data = loads(body)
+    decoded = time.perf_counter()
+
+    raw = getattr(response, "raw", None)
+    wire_bytes = raw.tell() if raw is not None and hasattr(raw, "tell") else len(body)
+    return data, {
+        "wire_bytes": wire_bytes,
+        "bytes": len(body),
+        "encoding": response.headers.get("Content-Encoding", "identity"),
+        "transfer": transferred - start,
+        "decode": decoded - transferred,
+    }
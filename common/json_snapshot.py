@@ -0,0 +1,128 @@
+"""
+Indexed snapshot file of serialized JSON documents.
+
+A snapshot holds a list of JSON documents, already serialized, and an index
+from string keys to the documents each key matches. The MySQL sync writes one
+of the progress_tracker table after every run, and the query API serves its
+lookups from it without a database connection. The file is opened with mmap,
+so only the pages a lookup touches are read, and a lookup hashes the key into
+an open addressing table stored in the file, so its cost does not grow with
+the number of studies.
+
+Layout (little-endian):
+    header:    magic, number of documents, number of slots, version stamp,
+               offset of the document index
+    slots:     number of slots x (key hash, entry offset), 0 offset = empty;
+               the number of slots is a power of two at least twice the keys
+    entries:   per key, key length, number of documents, UTF-8 key and the
+               numbers of the documents it matches
+    doc index: per document, offset and length
+    documents: the serialized documents, in the order they were given
+
+write_snapshot writes to a temporary file next to the target and renames it
+into place, so a reader never sees a partly written snapshot.
+"""
+import hashlib
+import mmap
+import os
+import struct
+
+MAGIC = b'HEALSNP1'
+
+_HEADER = struct.Struct('<8sII32sQ')
+_SLOT = struct.Struct('<QQ')
+_ENTRY = struct.Struct('<HI')
+_DOC = struct.Struct('<QI')
+
+
+def _hash(key: bytes) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def index_key(column: str, value: str) -> str:
+    """Index key for `value` of the lookup column `column`; lowercased, as MySQL compares them."""
+    return f"{column}\x1f{value.lower()}"
+
+
+def write_snapshot(path: str, documents: list, keys: dict, version: str = ''):
+    """
+    Write a snapshot file.
+
+    Args:
+        path:      File to write.
+        documents: Serialized JSON documents (str), in the order lookups return them.
+        keys:      Index key -> list of document numbers (positions in `documents`).
+        version:   Version stamp of the data, up to 32 ASCII characters.
+    """
+    n_slots = 1
+    while n_slots < 2 * len(keys):
+        n_slots *= 2
+    slots = [(0, 0)] * n_slots
+    entries = bytearray()
+    entries_offset = _HEADER.size + n_slots * _SLOT.size
+    for key, numbers in keys.items():
+        encoded = key.encode('utf-8')
+        key_hash = _hash(encoded)
+        slot = key_hash & (n_slots - 1)
+        while slots[slot][1]:
+            slot = (slot + 1) & (n_slots - 1)
+        slots[slot] = (key_hash, entries_offset + len(entries))
+        entries += _ENTRY.pack(len(encoded), len(numbers)) + encoded + struct.pack(f'<{len(numbers)}I', *numbers)
+
+    doc_index_offset = entries_offset + len(entries)
+    docs_offset = doc_index_offset + len(documents) * _DOC.size
+    doc_index = bytearray()
+    body = bytearray()
+    for document in documents:
+        encoded = document.encode('utf-8')
+        doc_index += _DOC.pack(docs_offset + len(body), len(encoded))
+        body += encoded
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(documents), n_slots, version.encode('ascii'), doc_index_offset))
+        for slot in slots:
+            f.write(_SLOT.pack(*slot))
+        f.write(entries)
+        f.write(doc_index)
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, self._slots, version, self._doc_index = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        self.version = version.rstrip(b'\0').decode('ascii') or None
+
+    def numbers(self, key: str) -> list:
+        """Numbers of the documents `key` matches, in the order they were written; [] if none."""
+        encoded = key.encode('utf-8')
+        key_hash = _hash(encoded)
+        mask = self._slots - 1
+        slot = key_hash & mask
+        while True:
+            slot_hash, offset = _SLOT.unpack_from(self._map, _HEADER.size + slot * _SLOT.size)
+            if not offset:
+                return []
+            if slot_hash == key_hash:
+                key_length, count = _ENTRY.unpack_from(self._map, offset)
+                start = offset + _ENTRY.size
+                if self._map[start:start + key_length] == encoded:
+                    return list(struct.unpack_from(f'<{count}I', self._map, start + key_length))
+            slot = (slot + 1) & mask
+
+    def document(self, number: int) -> bytes:
+        """Serialized document `number`, as UTF-8 bytes."""
+        offset, length = _DOC.unpack_from(self._map, self._doc_index + number * _DOC.size)
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,814 @@
+"""
+Shared page fetcher for the MDS `/mds/metadata` endpoint.
+
+Both the MySQL sync (mds_data_sync/mds2mysql) and the MongoDB sync
+(mds_data_sync/mds2mongo) pull every GUID from the MDS in `limit`/`offset`
+pages. This module keeps a pooled `requests.Session` so that pages reuse
+the same TCP/TLS connections, and keeps up to `concurrency` pages in flight
+at once so that wall-clock time scales with the concurrency limit rather
+than with the number of pages.
+
+Pagination has no fixed upper bound: offsets are scheduled until the MDS
+returns an empty page. Unless a fixed page size is requested, the page size
+is tuned from the latency and size of the pages already received.
+
+Each page is retried with jittered exponential backoff. A page that still
+fails aborts the fetch with MDSFetchError instead of being dropped, so a
+partial dataset never reaches the sinks. When a checkpoint directory is
+configured, every page received is written there as it arrives and a rerun
+only requests the offsets that are not already on disk.
+
+fetch_mds_pages returns the whole response as one dict, decoded with the
+fastest available JSON backend (see json_backend.py). iter_mds_records is
+the streaming alternative: each GUID record is decoded as its bytes arrive
+from the socket and yielded straight away, so neither the raw response nor
+the complete dict is ever held in memory. Pages are requested with gzip
+transfer encoding, and the per-page stats separate transfer time from
+decode time.
+"""
+import codecs
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import json_backend
+
+logger = logging.getLogger(__name__)
+
+MDS_URL = "https://healdata.org/mds/metadata"
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 120
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+# Checkpointed pages older than this are from an earlier run and are discarded
+DEFAULT_CHECKPOINT_TTL = 6 * 60 * 60
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_CHECKPOINT_PATTERN = re.compile(r"page-(\d+)-(\d+)\.json\.gz$")
+
+
+class MDSFetchError(RuntimeError):
+    """Raised when an MDS page cannot be fetched after all retries."""
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class FetchStats:
+    """
+    Per-page sizes and latencies collected while fetching from the MDS.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, offset: int, limit: int, records: int, nbytes: int, latency: float,
+               wire_bytes: int = None, transfer: float = None, decode: float = None):
+        """
+        Args:
+            nbytes:     Decompressed body size.
+            latency:    Seconds from request to decoded page.
+            wire_bytes: Bytes received on the wire (compressed); defaults to `nbytes`.
+            transfer:   Seconds spent receiving the body, when measured separately.
+            decode:     Seconds spent decoding the JSON, when measured separately.
+        """
+        wire_bytes = nbytes if wire_bytes is None else wire_bytes
+        self.pages.append({
+            "offset": offset,
+            "limit": limit,
+            "records": records,
+            "bytes": nbytes,
+            "wire_bytes": wire_bytes,
+            "latency": latency,
+            "transfer": transfer,
+            "decode": decode,
+        })
+        if decode is None:
+            logger.info("Page offset=%d limit=%d records=%d bytes=%d wire_bytes=%d latency=%.2fs",
+                        offset, limit, records, nbytes, wire_bytes, latency)
+        else:
+            logger.info("Page offset=%d limit=%d records=%d bytes=%d wire_bytes=%d latency=%.2fs "
+                        "transfer=%.2fs decode=%.2fs", offset, limit, records, nbytes, wire_bytes,
+                        latency, transfer, decode)
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        """
+        Totals for the fetch plus records/sec achieved by each page size, so the
+        page size with the best throughput can be picked.
+        """
+        latencies = sorted(p["latency"] for p in self.pages)
+        by_size = {}
+        for p in self.pages:
+            if p["records"] == 0:
+                continue
+            size = by_size.setdefault(p["limit"], {"pages": 0, "records": 0, "seconds": 0.0})
+            size["pages"] += 1
+            size["records"] += p["records"]
+            size["seconds"] += p["latency"]
+        for size in by_size.values():
+            size["records_per_sec"] = round(size["records"] / size["seconds"], 1) if size["seconds"] else 0.0
+        return {
+            "pages": len(self.pages),
+            "records": sum(p["records"] for p in self.pages),
+            "bytes": sum(p["bytes"] for p in self.pages),
+            "wire_bytes": sum(p["wire_bytes"] for p in self.pages),
+            "transfer_seconds": round(sum(p["transfer"] or 0.0 for p in self.pages), 3),
+            "decode_seconds": round(sum(p["decode"] or 0.0 for p in self.pages), 3),
+            "json_backend": json_backend.BACKEND,
+            "elapsed": round((self.finished or time.perf_counter()) - self.started, 2),
+            "latency_mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "latency_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else 0.0,
+            "latency_max": round(latencies[-1], 3) if latencies else 0.0,
+            "throughput_by_page_size": dict(sorted(by_size.items())),
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        logger.info("Fetched %d records in %d pages (%d bytes) in %.2fs; page latency mean=%.2fs p95=%.2fs max=%.2fs",
+                    summary["records"], summary["pages"], summary["bytes"], summary["elapsed"],
+                    summary["latency_mean"], summary["latency_p95"], summary["latency_max"])
+        if summary["decode_seconds"]:
+            logger.info("  %d wire bytes for %d body bytes; transfer %.2fs vs %s decode %.2fs",
+                        summary["wire_bytes"], summary["bytes"], summary["transfer_seconds"],
+                        summary["json_backend"], summary["decode_seconds"])
+        for limit, size in summary["throughput_by_page_size"].items():
+            logger.info("  page size %d: %d pages, %.1f records/sec", limit, size["pages"], size["records_per_sec"])
+
+
+class PageSizeTuner:
+    """
+    Pick the next page size from the latency and size of pages received so far.
+
+    Per-record latency and bytes are tracked as moving averages; the next page
+    is sized so that it is expected to take about `target_latency` seconds and
+    stay below `max_bytes`, clamped to [`min_size`, `max_size`].
+    """
+
+    def __init__(self, initial: int = DEFAULT_PAGE_SIZE, min_size: int = 100, max_size: int = 5000,
+                 target_latency: float = 5.0, max_bytes: int = 32 * 1024 * 1024, step: int = 50,
+                 smoothing: float = 0.5):
+        self.size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.step = step
+        self.smoothing = smoothing
+        self._sec_per_record = None
+        self._bytes_per_record = None
+
+    def _smooth(self, current, observed):
+        if current is None:
+            return observed
+        return self.smoothing * observed + (1 - self.smoothing) * current
+
+    def observe(self, records: int, nbytes: int, latency: float):
+        if records <= 0:
+            return
+        self._sec_per_record = self._smooth(self._sec_per_record, latency / records)
+        self._bytes_per_record = self._smooth(self._bytes_per_record, nbytes / records)
+
+        by_latency = self.target_latency / self._sec_per_record if self._sec_per_record else self.max_size
+        by_bytes = self.max_bytes / self._bytes_per_record if self._bytes_per_record else self.max_size
+        size = int(min(by_latency, by_bytes) // self.step * self.step)
+        self.size = max(self.min_size, min(self.max_size, size))
+
+    def next_size(self) -> int:
+        return self.size
+
+
+def create_session(pool_size: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    """
+    Create a `requests.Session` whose connection pool can hold one keep-alive
+    connection per in-flight page, and which asks for compressed responses.
+    """
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = json_backend.ACCEPT_ENCODING
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_page(session: requests.Session, base_url: str, offset: int, limit: int,
+               timeout: int = DEFAULT_TIMEOUT):
+    """
+    Fetch a single page of MDS records.
+
+    Returns:
+        Tuple of (page, timings) where page maps GUID to its full metadata
+        record and is empty once `offset` is past the last GUID, and timings
+        holds the keyword arguments for FetchStats.record.
+    """
+    params = {"data": "True", "limit": limit, "offset": offset}
+    start = time.perf_counter()
+    with session.get(base_url, params=params, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        page, timings = json_backend.read_json_response(response)
+    return page, {
+        "nbytes": timings["bytes"],
+        "latency": time.perf_counter() - start,
+        "wire_bytes": timings["wire_bytes"],
+        "transfer": timings["transfer"],
+        "decode": timings["decode"],
+    }
+
+
+def iter_json_object_items(chunks):
+    """
+    Incrementally decode a JSON object from an iterable of byte chunks,
+    yielding each (key, value) pair of the top-level object as soon as its
+    bytes have arrived. Only the value currently being decoded is buffered.
+
+    Raises:
+        ValueError: if the input is not a JSON object or ends early.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+
+    def read_more(min_chars=1):
+        # Returns False once the input is exhausted
+        nonlocal buf, pos, eof
+        buf = buf[pos:]
+        pos = 0
+        target = len(buf) + min_chars
+        while len(buf) < target:
+            chunk = next(chunks, None)
+            if chunk is None:
+                buf += utf8.decode(b"", final=True)
+                eof = True
+                return False
+            buf += utf8.decode(chunk)
+        return True
+
+    def next_char():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\n\r":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not read_more():
+                raise ValueError("Unexpected end of JSON input")
+
+    def decode_value():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Read at least as much again as is buffered, so that a large
+                # value is re-scanned a logarithmic number of times
+                read_more(max(len(buf) - pos, STREAM_CHUNK_SIZE))
+                continue
+            # A number cut off at the end of the buffer decodes short
+            # ("12" of "12.5"), so numbers must be followed by a delimiter
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not eof:
+                tail = end
+                while tail < len(buf) and buf[tail] in "0123456789.eE+-":
+                    tail += 1
+                if tail == len(buf):
+                    read_more()
+                    continue
+            pos = end
+            return value
+
+    if next_char() != "{":
+        raise ValueError("Expected a JSON object")
+    pos += 1
+    if next_char() == "}":
+        return
+    while True:
+        if next_char() != '"':
+            raise ValueError(f"Expected an object key at position {pos}")
+        key = decode_value()
+        if next_char() != ":":
+            raise ValueError(f"Expected ':' at position {pos}")
+        pos += 1
+        next_char()
+        yield key, decode_value()
+        separator = next_char()
+        pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' at position {pos - 1}")
+
+
+def stream_page(session: requests.Session, base_url: str, offset: int, limit: int, emit,
+                timeout: int = DEFAULT_TIMEOUT):
+    """
+    Fetch a single page of MDS records, passing each (guid, record) pair to
+    `emit` as it is decoded from the response body.
+
+    The standard library decoder is used here whatever json_backend
+    selects, since orjson has no incremental API.
+
+    Returns:
+        Tuple of (count, timings) with timings as for fetch_page; transfer
+        and decode are interleaved, so only the total latency is reported.
+    """
+    params = {"data": "True", "limit": limit, "offset": offset}
+    start = time.perf_counter()
+    count = 0
+    nbytes = 0
+    with session.get(base_url, params=params, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+
+        def chunks():
+            nonlocal nbytes
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                nbytes += len(chunk)
+                yield chunk
+
+        for guid, record in iter_json_object_items(chunks()):
+            emit(guid, record)
+            count += 1
+        wire_bytes = response.raw.tell()
+    return count, {"nbytes": nbytes, "latency": time.perf_counter() - start, "wire_bytes": wire_bytes}
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is None or status == 429 or status >= 500
+    # Connection errors, timeouts and truncated bodies that fail to decode
+    return isinstance(error, (requests.RequestException, ValueError))
+
+
+def backoff_delay(attempt: int, base: float = DEFAULT_BACKOFF, cap: float = DEFAULT_MAX_BACKOFF) -> float:
+    """Full-jitter exponential backoff: a random delay in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _with_retries(request, offset: int, limit: int, retries: int, backoff: float):
+    for attempt in range(retries + 1):
+        try:
+            return request()
+        except Exception as e:
+            if attempt == retries or not _is_retryable(e):
+                raise MDSFetchError(f"Failed to fetch offset {offset} (limit {limit}) "
+                                    f"after {attempt + 1} attempt(s): {e}") from e
+            delay = backoff_delay(attempt, backoff)
+            logger.warning("Error fetching offset %d (attempt %d/%d): %s; retrying in %.1fs",
+                           offset, attempt + 1, retries + 1, e, delay)
+            time.sleep(delay)
+
+
+def fetch_page_with_retries(session: requests.Session, base_url: str, offset: int, limit: int,
+                            retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF):
+    """
+    Fetch a single page, retrying connection errors, timeouts, 429 and 5xx
+    responses with jittered exponential backoff.
+
+    Raises:
+        MDSFetchError: if the page still fails after `retries` retries, or
+            fails with an error that is not worth retrying (e.g. a 404).
+    """
+    return _with_retries(lambda: fetch_page(session, base_url, offset, limit), offset, limit, retries, backoff)
+
+
+def _checkpoint_path(checkpoint_dir: str, offset: int, count: int) -> str:
+    return os.path.join(checkpoint_dir, f"page-{offset:09d}-{count}.json.gz")
+
+
+def write_checkpoint_page(checkpoint_dir: str, offset: int, page: dict):
+    """
+    Write a non-empty page to `checkpoint_dir` as page-<offset>-<count>.json.gz.
+    The file is written under a temporary name and renamed so that a run
+    interrupted mid-write never leaves a truncated page behind.
+    """
+    path = _checkpoint_path(checkpoint_dir, offset, len(page))
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+        json.dump(page, f)
+    os.replace(tmp_path, path)
+
+
+class _CheckpointWriter:
+    """
+    Writes a streamed page to the checkpoint directory one record at a time,
+    in the same format as write_checkpoint_page.
+    """
+
+    def __init__(self, checkpoint_dir: str, offset: int):
+        self.checkpoint_dir = checkpoint_dir
+        self.offset = offset
+        self.tmp_path = os.path.join(checkpoint_dir, f"page-{offset:09d}.json.gz.tmp")
+        self.count = 0
+        self.file = gzip.open(self.tmp_path, "wt", encoding="utf-8", compresslevel=1)
+        self.file.write("{")
+
+    def write(self, guid, record):
+        if self.count:
+            self.file.write(",")
+        self.file.write(json.dumps(guid))
+        self.file.write(":")
+        json.dump(record, self.file)
+        self.count += 1
+
+    def commit(self):
+        self.file.write("}")
+        self.file.close()
+        if self.count:
+            os.replace(self.tmp_path, _checkpoint_path(self.checkpoint_dir, self.offset, self.count))
+        else:
+            os.remove(self.tmp_path)
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+
+def list_checkpoint_pages(checkpoint_dir: str, ttl: float = None) -> dict:
+    """
+    List the pages saved in `checkpoint_dir` without reading them.
+
+    Args:
+        checkpoint_dir: Directory written by write_checkpoint_page.
+        ttl:            Pages older than this many seconds are deleted instead
+                        of listed. None keeps every page.
+
+    Returns:
+        Dict mapping offset to (record count, path).
+    """
+    pages = {}
+    now = time.time()
+    for path in glob.glob(os.path.join(checkpoint_dir, "page-*.json.gz")):
+        match = _CHECKPOINT_PATTERN.search(os.path.basename(path))
+        if not match:
+            continue
+        if ttl is not None and now - os.path.getmtime(path) > ttl:
+            logger.info("Discarding stale checkpoint page %s", path)
+            os.remove(path)
+            continue
+        pages[int(match.group(1))] = (int(match.group(2)), path)
+    return pages
+
+
+def read_checkpoint_page(path: str) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_checkpoint_pages(checkpoint_dir: str, ttl: float = None) -> dict:
+    """
+    Load the pages saved in `checkpoint_dir`.
+
+    Returns:
+        Dict mapping offset to page. Unreadable pages are skipped, so their
+        offsets are fetched again.
+    """
+    pages = {}
+    for offset, (_, path) in list_checkpoint_pages(checkpoint_dir, ttl).items():
+        try:
+            pages[offset] = read_checkpoint_page(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint page %s: %s", path, e)
+    return pages
+
+
+def clear_checkpoint(checkpoint_dir: str):
+    for path in glob.glob(os.path.join(checkpoint_dir, "page-*.json.gz*")):
+        os.remove(path)
+
+
+class _OffsetPlanner:
+    """
+    Tracks which offset ranges are already covered by checkpointed pages so
+    that only the missing ranges are requested.
+    """
+
+    def __init__(self, counts: dict):
+        covered = sorted((offset, offset + count) for offset, count in counts.items() if count)
+        self.covered = []
+        for start, end in covered:
+            if self.covered and start <= self.covered[-1][1]:
+                self.covered[-1] = (self.covered[-1][0], max(self.covered[-1][1], end))
+            else:
+                self.covered.append((start, end))
+
+    def clip(self, offset: int, limit: int):
+        """Move `offset` past covered ranges and shorten `limit` to stop at the next one."""
+        for start, end in self.covered:
+            if start <= offset < end:
+                offset = end
+            elif offset < start:
+                return offset, min(limit, start - offset)
+        return offset, limit
+
+    def gaps(self, offset: int, limit: int):
+        """Uncovered (offset, limit) ranges within [offset, offset + limit)."""
+        stop = offset + limit
+        ranges = []
+        while offset < stop:
+            offset, length = self.clip(offset, stop - offset)
+            if offset >= stop:
+                break
+            ranges.append((offset, length))
+            offset += length
+        return ranges
+
+
+class _PageScheduler:
+    """
+    Chooses the (offset, limit) of the next page to request.
+
+    Offsets are handed out back to back, skipping ranges covered by the
+    checkpoint, until a page comes back empty. A page that returns fewer
+    records than requested is followed up where it stopped.
+    """
+
+    def __init__(self, page_size: int, checkpoint_counts: dict, stats: FetchStats):
+        self.page_size = page_size
+        self.tuner = None if page_size else PageSizeTuner()
+        self.planner = _OffsetPlanner(checkpoint_counts)
+        self.stats = stats
+        self.end_offset = None
+        self.next_offset = 0
+        self.follow_ups = deque()
+
+    def next_request(self):
+        if self.follow_ups:
+            return self.follow_ups.popleft()
+        if self.end_offset is not None:
+            return None
+        offset, limit = self.planner.clip(self.next_offset, self.page_size or self.tuner.next_size())
+        self.next_offset = offset + limit
+        return offset, limit
+
+    def page_done(self, offset: int, limit: int, count: int, timings: dict):
+        self.stats.record(offset, limit, count, **timings)
+        if self.tuner:
+            self.tuner.observe(count, timings["nbytes"], timings["latency"])
+        if count == 0:
+            self.end_offset = offset if self.end_offset is None else min(self.end_offset, offset)
+        elif count < limit:
+            remaining = offset + count
+            if self.end_offset is None or remaining < self.end_offset:
+                self.follow_ups.extend(self.planner.gaps(remaining, limit - count))
+
+    def is_past_end(self, offset: int) -> bool:
+        return self.end_offset is not None and offset >= self.end_offset
+
+
+def _fetch_options(base_url, page_size, concurrency, checkpoint_dir):
+    base_url = base_url or os.getenv("MDS_BASE_URL") or MDS_URL
+    page_size = page_size or _env_int("MDS_PAGE_SIZE", 0)
+    concurrency = concurrency or _env_int("MDS_FETCH_CONCURRENCY", DEFAULT_CONCURRENCY)
+    checkpoint_dir = checkpoint_dir or os.getenv("MDS_CHECKPOINT_DIR")
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    return base_url, page_size, concurrency, checkpoint_dir
+
+
+def fetch_mds_pages(base_url: str = None, page_size: int = None, concurrency: int = None,
+                    session: requests.Session = None, stats: FetchStats = None,
+                    retries: int = DEFAULT_RETRIES, checkpoint_dir: str = None,
+                    checkpoint_ttl: float = DEFAULT_CHECKPOINT_TTL, keep_checkpoint: bool = False) -> dict:
+    """
+    Fetch every MDS record, keeping up to `concurrency` pages in flight.
+
+    Offsets are scheduled back to back until a page comes back empty; pages
+    already in flight are allowed to finish and anything past the empty page
+    is discarded. A page that returns fewer records than requested (e.g. the
+    server caps `limit`) is followed up at the offset where it stopped, so no
+    GUIDs are skipped.
+
+    Args:
+        base_url:        URL of the `/mds/metadata` endpoint (default: $MDS_BASE_URL,
+                         e.g. a local mds_replay.py server, or the production MDS).
+        page_size:       Fixed records per page. Defaults to $MDS_PAGE_SIZE; when
+                         neither is set the page size is tuned as pages arrive.
+        concurrency:     Pages in flight at once (default: $MDS_FETCH_CONCURRENCY or 4).
+        session:         Optional session to reuse; one is created (and closed) otherwise.
+        stats:           Optional FetchStats to collect per-page sizes and latencies into.
+        retries:         Retries per page before the fetch is aborted.
+        checkpoint_dir:  Directory to save pages to as they arrive and resume from
+                         (default: $MDS_CHECKPOINT_DIR; no checkpointing when unset).
+        checkpoint_ttl:  Checkpointed pages older than this many seconds are ignored.
+        keep_checkpoint: Keep the checkpointed pages after a successful fetch.
+
+    Returns:
+        Dict mapping GUID to metadata record, in offset order.
+
+    Raises:
+        MDSFetchError: if any page still fails after its retries. Pages that
+            were received are left in the checkpoint directory.
+    """
+    base_url, page_size, concurrency, checkpoint_dir = _fetch_options(base_url, page_size, concurrency, checkpoint_dir)
+    stats = stats if stats is not None else FetchStats()
+
+    pages = {}
+    if checkpoint_dir:
+        pages = load_checkpoint_pages(checkpoint_dir, checkpoint_ttl)
+        if pages:
+            logger.info("Resuming from checkpoint %s: %d pages, %d records",
+                        checkpoint_dir, len(pages), sum(len(p) for p in pages.values()))
+    scheduler = _PageScheduler(page_size, {offset: len(page) for offset, page in pages.items()}, stats)
+
+    own_session = session is None
+    if own_session:
+        session = create_session(concurrency)
+
+    failure = None
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = {}
+            while True:
+                while failure is None and len(in_flight) < concurrency:
+                    request = scheduler.next_request()
+                    if request is None:
+                        break
+                    logger.debug("Query: %s?data=True&limit=%d&offset=%d", base_url, request[1], request[0])
+                    in_flight[pool.submit(fetch_page_with_retries, session, base_url, *request, retries)] = request
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset, limit = in_flight.pop(future)
+                    try:
+                        page, timings = future.result()
+                    except MDSFetchError as e:
+                        logger.error(str(e))
+                        failure = failure or e
+                        continue
+                    scheduler.page_done(offset, limit, len(page), timings)
+                    if page:
+                        pages[offset] = page
+                        if checkpoint_dir:
+                            write_checkpoint_page(checkpoint_dir, offset, page)
+    finally:
+        if own_session:
+            session.close()
+        stats.finish()
+
+    if failure is not None:
+        raise failure
+
+    complete_response = {}
+    for offset in sorted(pages):
+        if not scheduler.is_past_end(offset):
+            complete_response.update(pages[offset])
+    stats.log_summary()
+    if checkpoint_dir and not keep_checkpoint:
+        clear_checkpoint(checkpoint_dir)
+    return complete_response
+
+
+class _Cancelled(Exception):
+    pass
+
+
+_PAGE_DONE = object()
+
+
+def iter_mds_records(base_url: str = None, page_size: int = None, concurrency: int = None,
+                     session: requests.Session = None, stats: FetchStats = None,
+                     retries: int = DEFAULT_RETRIES, checkpoint_dir: str = None,
+                     checkpoint_ttl: float = DEFAULT_CHECKPOINT_TTL, keep_checkpoint: bool = False,
+                     buffer_size: int = 256):
+    """
+    Streaming counterpart of fetch_mds_pages: yields (guid, record) pairs as
+    each record is decoded from the socket, with the same pagination,
+    concurrency, retry and checkpoint behaviour.
+
+    Records arrive in the order they are decoded, so pages fetched
+    concurrently interleave. A page that is retried after a partial read is
+    streamed again from the start; GUIDs that were already yielded are not
+    yielded twice. Checkpointed pages are read back one at a time.
+
+    Args:
+        buffer_size: Decoded records that may wait for the consumer before
+                     the fetching threads block. Bounds peak memory.
+        (remaining arguments as for fetch_mds_pages)
+
+    Raises:
+        MDSFetchError: if any page still fails after its retries.
+    """
+    base_url, page_size, concurrency, checkpoint_dir = _fetch_options(base_url, page_size, concurrency, checkpoint_dir)
+    stats = stats if stats is not None else FetchStats()
+
+    checkpointed = list_checkpoint_pages(checkpoint_dir, checkpoint_ttl) if checkpoint_dir else {}
+    scheduler = _PageScheduler(page_size, {offset: count for offset, (count, _) in checkpointed.items()}, stats)
+
+    own_session = session is None
+    if own_session:
+        session = create_session(concurrency)
+
+    records = queue.Queue(maxsize=buffer_size)
+    cancelled = threading.Event()
+
+    def put(item):
+        while True:
+            if cancelled.is_set():
+                raise _Cancelled()
+            try:
+                records.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def fetch(offset, limit):
+        def attempt():
+            writer = _CheckpointWriter(checkpoint_dir, offset) if checkpoint_dir else None
+
+            def emit(guid, record):
+                put((guid, record))
+                if writer:
+                    writer.write(guid, record)
+            try:
+                result = stream_page(session, base_url, offset, limit, emit)
+            except BaseException:
+                if writer:
+                    writer.discard()
+                raise
+            if writer:
+                writer.commit()
+            return result
+
+        try:
+            result = _with_retries(attempt, offset, limit, retries, DEFAULT_BACKOFF)
+        except (MDSFetchError, _Cancelled) as e:
+            result = e
+        try:
+            put((_PAGE_DONE, (offset, limit, result)))
+        except _Cancelled:
+            pass
+
+    seen = set()
+    failure = None
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for offset in sorted(checkpointed):
+            count, path = checkpointed[offset]
+            logger.info("Reading %d records for offset %d from checkpoint", count, offset)
+            for guid, record in read_checkpoint_page(path).items():
+                if guid not in seen:
+                    seen.add(guid)
+                    yield guid, record
+
+        in_flight = 0
+        while True:
+            while failure is None and in_flight < concurrency:
+                request = scheduler.next_request()
+                if request is None:
+                    break
+                logger.debug("Query: %s?data=True&limit=%d&offset=%d", base_url, request[1], request[0])
+                pool.submit(fetch, *request)
+                in_flight += 1
+            if not in_flight:
+                break
+
+            guid, item = records.get()
+            if guid is _PAGE_DONE:
+                in_flight -= 1
+                offset, limit, result = item
+                if isinstance(result, MDSFetchError):
+                    logger.error(str(result))
+                    failure = failure or result
+                else:
+                    scheduler.page_done(offset, limit, *result)
+            elif guid not in seen:
+                seen.add(guid)
+                yield guid, item
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=True)
+        if own_session:
+            session.close()
+        stats.finish()
+
+    if failure is not None:
+        raise failure
+    stats.log_summary()
+    if checkpoint_dir and not keep_checkpoint:
+        clear_checkpoint(checkpoint_dir)
@@ -0,0 +1,29 @@
+"""
+Public columns of the progress_tracker table, the ones the query API returns.
+
+progress_tracker_dd.csv declares every column of the table. row_hash and the
+generated lookup key columns (those with a var_expression) only serve the
+sync and the lookups and are left out. The dictionary is read with the csv
+module, so the query API can use this without pandas; its Lambda package
+carries a copy of progress_tracker_dd.csv next to this module.
+"""
+import csv
+import os
+
+# Columns of the data dictionary that are not returned
+INTERNAL_COLUMNS = ['row_hash']
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+# Next to this module in a Lambda package, otherwise the MySQL sync's copy in the repository
+DD_PATHS = [
+    os.path.join(_HERE, 'progress_tracker_dd.csv'),
+    os.path.join(_HERE, '..', 'mds_data_sync', 'mds2mysql', 'progress_tracker_dd.csv'),
+]
+
+
+def public_columns(dd_path: str = None) -> list:
+    """Names of the public columns, in table order."""
+    path = dd_path or next((path for path in DD_PATHS if os.path.exists(path)), DD_PATHS[-1])
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row['var_name'] for row in csv.DictReader(f)
+                if row['var_name'] not in INTERNAL_COLUMNS and not row['var_expression'].strip()]
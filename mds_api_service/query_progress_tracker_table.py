@@ -1,93 +1,496 @@
+import csv
+import io
 import json
 import os
-import mysql.connector
+import sys
+import time
+from collections import OrderedDict
 from decimal import Decimal
-from datetime import datetime
-from dotenv import load_dotenv
+from datetime import date
+
+# Modules shared with the syncs live in <repo>/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from json_snapshot import Snapshot, index_key
+from progress_tracker_columns import public_columns
 
 class EnhancedEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
             return float(obj)  # Convert Decimal to float
-        if isinstance(obj, datetime):
-            return obj.isoformat()  # Convert datetime to ISO 8601 string
+        if isinstance(obj, date):
+            return obj.isoformat()  # Convert date and datetime to ISO 8601 string
         return super(EnhancedEncoder, self).default(obj)
 
-def parse_json_fields(data):
-    json_fields = ['investigators_name', 'repository_metadata', 'dmp_plan', 'heal_cde_used', 'vlmd_metadata']
-    for field in json_fields:
-        if field in data and isinstance(data[field], str):
-            try:
-                data[field] = json.loads(data[field].replace("'", "\""))  # Replace single quotes with double quotes
-            except json.JSONDecodeError:
-                pass  # If it fails, keep it as a string
-    return data
-
-load_dotenv()
-
-# Accessing variables
-db_username = os.getenv('DB_USER')
-db_password = os.getenv('DB_PASSWORD')
-db_host = os.getenv('DB_HOST')
-db_database = os.getenv('DB_NAME')
-table_name = os.getenv('TABLE_NAME')
+def connector():
+    """mysql.connector, imported on first use so that cold starts served from the snapshot never load it."""
+    import mysql.connector
+    return mysql.connector
 
-def lambda_handler(event, context):
-    appl_id = proj_num = hdp_id = ''
+def database_errors():
+    """mysql.connector.Error once the connector has been imported; before that no database error can occur."""
+    module = sys.modules.get('mysql.connector')
+    return module.Error if module is not None else ()
+
+def rows_to_dicts(cursor):
+    """
+    Fetched rows as dicts, with the values of MySQL JSON columns
+    (investigators_name, repository_metadata, ...) decoded once here.
+    """
+    columns = [column[0] for column in cursor.description]
+    json_columns = [i for i, column in enumerate(cursor.description) if column[1] == connector().FieldType.JSON]
     results = []
+    for row in cursor.fetchall():
+        row = list(row)
+        for i in json_columns:
+            if row[i] is not None:
+                row[i] = json.loads(row[i])
+        results.append(dict(zip(columns, row)))
+    return results
+
+# Lookup key column for each query parameter; each is the column with its dashes removed
+LOOKUP_KEYS = {'appl_id': 'appl_id_key', 'proj_num': 'project_num_key', 'hdp_id': 'hdp_id_key'}
+
+# Content type of each response format
+FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def quote_name(name):
+    return "`" + name.replace("`", "``") + "`"
+
+def parse_fields(fields):
+    """Columns requested with fields= (comma separated, or a list in a batch body), without repeats; None for all."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return tuple(dict.fromkeys(field.strip() for field in fields if field.strip())) or None
+
+def check_fields(fields, columns):
+    unknown = [field for field in fields if field not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+def project(row, fields):
+    """The requested columns of a row, in the requested order; the public columns if fields is None."""
+    return {field: row[field] for field in (fields if fields is not None else public_fields)}
+
+def normalize_id(param, value):
+    """Normalize a query parameter value the way the key columns are stored."""
+    if param == 'appl_id':
+        return value.replace('-', '') if value.startswith('CTN') else value  # Remove dashes if CTN prefix is present
+    if param == 'proj_num':
+        return value.replace('-', '')  # Remove dashes from proj_num
+    return value.upper()
+
+def build_lookup_query(table_name, lookups, columns):
+    """
+    SELECT of the rows matching any of the given ids, as a UNION ALL of one
+    IN lookup per key column so each part can use the column's index. A row
+    matching more than one key comes back once per key.
 
+    Args:
+        lookups: key column -> list of normalized ids
+        columns: columns to select
+    """
+    select = ", ".join(quote_name(column) for column in columns)
+    parts = []
+    params = []
+    for key, values in lookups.items():
+        if values:
+            parts.append(f"SELECT {select} FROM {table_name} WHERE {key} IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+    if not parts:
+        # Nothing to look up; an always-false query keeps the response shape
+        return f"SELECT {select} FROM {table_name} WHERE 1=0;", ()
+    return " UNION ALL ".join(parts) + " ORDER BY hdp_id;", tuple(params)
+
+def build_page_query(table_name, lookups, columns, cursor=None, limit=None):
+    """
+    SELECT of one page of the rows matching any of the given ids, in hdp_id
+    order after `cursor`. The ids are ORed in one WHERE so each row comes back
+    once and LIMIT counts rows; one more row than `limit` is asked for, to
+    tell whether there is a next page.
+
+    Args:
+        lookups: key column -> list of normalized ids
+        columns: columns to select
+    """
+    select = ", ".join(quote_name(column) for column in columns)
+    conditions = []
+    params = []
+    for key, values in lookups.items():
+        if values:
+            conditions.append(f"{key} IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+    where = "(" + " OR ".join(conditions) + ")" if conditions else "1=0"
+    if cursor is not None:
+        where += " AND hdp_id > %s"
+        params.append(cursor)
+    query = f"SELECT {select} FROM {table_name} WHERE {where} ORDER BY hdp_id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    return query + ";", tuple(params)
+
+# Settings, read from the environment by configure() on the first invocation
+db_username = None
+db_password = None
+db_host = None
+db_database = None
+table_name = None
+# Seconds between checks of the table's version stamp
+cache_ttl = 300
+# Most (fields, id) lookups kept in the cache; the least recently used are evicted past this
+cache_max_entries = 10000
+# Snapshot file written by the MDS sync (e.g. /opt/progress_tracker.snap from a layer); lookups are
+# served from it instead of the database when it exists
+snapshot_path = None
+# Columns returned when no fields are requested: the data dictionary without row_hash and the key columns
+public_fields = None
+_configured = False
+
+def configure():
+    """
+    Read the settings from the environment, after loading a .env file when
+    python-dotenv is installed (local runs; the Lambda package leaves it out).
+    """
+    global db_username, db_password, db_host, db_database, table_name
+    global cache_ttl, cache_max_entries, snapshot_path, public_fields, _configured
     try:
-        appl_id = event['queryStringParameters'].get('appl_id', '')
-        proj_num = event['queryStringParameters'].get('proj_num', '')
-        hdp_id = event['queryStringParameters'].get('hdp_id', '').upper()
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv()
+    db_username = os.getenv('DB_USER')
+    db_password = os.getenv('DB_PASSWORD')
+    db_host = os.getenv('DB_HOST')
+    db_database = os.getenv('DB_NAME')
+    table_name = os.getenv('TABLE_NAME')
+    cache_ttl = int(os.getenv('PROGRESS_TRACKER_CACHE_TTL', 300))
+    cache_max_entries = int(os.getenv('PROGRESS_TRACKER_CACHE_SIZE', 10000))
+    snapshot_path = os.getenv('PROGRESS_TRACKER_SNAPSHOT')
+    public_fields = public_columns()
+    _configured = True
 
-        if appl_id.startswith('CTN'):
-            normalized_appl_id = appl_id.replace('-', '')  # Remove dashes if CTN prefix is present
-        else:
-            normalized_appl_id = appl_id
+# Kept across warm invocations of the Lambda
+_connection = None
+# (fields, key column, normalized id) -> matching rows, valid for _cache_version of the table
+_cache = OrderedDict()
+_cache_version = None
+_version_checked_at = None
+_snapshot = None
+_snapshot_stat = None
 
-        normalized_proj_num = proj_num.replace('-', '')  # Remove dashes from proj_num
+def get_connection():
+    """
+    The container's MySQL connection, reconnecting if it has been dropped.
 
-        conn = mysql.connector.connect(
-            user=db_username, 
-            password=db_password, 
-            host=db_host, 
-            database=db_database
+    The connection is kept for the life of the container, so it runs in
+    autocommit: each read sees the latest committed rows and version stamp
+    instead of the snapshot of a transaction left open by the first query,
+    and holds no metadata lock that would block the sync's RENAME TABLE.
+    """
+    global _connection
+    if _connection is None:
+        _connection = connector().connect(
+            user=db_username,
+            password=db_password,
+            host=db_host,
+            database=db_database,
+            autocommit=True
         )
+    else:
+        _connection.ping(reconnect=True)
+    return _connection
 
-        cursor = conn.cursor()
+def refresh_cache():
+    """Empty the cache if the sync has written a new version of the table since it was filled."""
+    global _cache_version, _version_checked_at
+    now = time.monotonic()
+    if _version_checked_at is not None and now - _version_checked_at < cache_ttl:
+        return
+    cursor = get_connection().cursor()
+    try:
+        cursor.execute("SELECT version FROM table_versions WHERE table_name=%s;", (table_name,))
+        row = cursor.fetchone()
+    except connector().Error:
+        row = None  # No version stamp yet; cache for one TTL at a time
+    finally:
+        cursor.close()
+    version = row[0] if row else None
+    if version != _cache_version or version is None:
+        _cache.clear()
+        _cache_version = version
+    _version_checked_at = now
+
+def lookup(ids, fields=None):
+    """
+    Rows matching each id, from the cache where possible and otherwise with
+    one query for all the ids that are not cached.
+
+    Args:
+        ids:    list of (key column, normalized id)
+        fields: columns the caller needs, selected in SQL; None for the public columns.
+                Rows also carry hdp_id and the key columns, which project() drops.
 
-        # Sample query - modify as needed
-        query = f"SELECT * FROM {table_name} WHERE REPLACE(appl_id, '-', '')=%s OR REPLACE(project_num, '-', '')=%s OR REPLACE(hdp_id, '-', '')=%s;"
-        cursor.execute(query, (normalized_appl_id, normalized_proj_num, hdp_id))
+    Returns:
+        Dict of (key column, normalized id) -> list of rows
+    """
+    refresh_cache()
+    if fields is not None:
+        check_fields(fields, public_fields)
+    columns = list(dict.fromkeys(['hdp_id', *LOOKUP_KEYS.values(), *(fields if fields is not None else public_fields)]))
+    # Rows carry every requested field whatever the order, so the order does not make a new cache entry
+    cached_fields = None if fields is None else frozenset(fields)
+    found = {}
+    missing = {}
+    for key, value in ids:
+        if (cached_fields, key, value) in _cache:
+            _cache.move_to_end((cached_fields, key, value))
+            found[(key, value)] = _cache[(cached_fields, key, value)]
+        elif (key, value) not in found:
+            found[(key, value)] = []
+            missing.setdefault(key, []).append(value)
 
-        # Check if the cursor.description is not None
-        if cursor.description is not None:
-            columns = [column[0] for column in cursor.description]
-            rows = cursor.fetchall()
+    if any(missing.values()):
+        query, params = build_lookup_query(table_name, missing, columns)
+        cursor = get_connection().cursor()
+        try:
+            cursor.execute(query, params)
+            # A row matching several of the UNION ALL parts comes back once per part
+            rows = list({row['hdp_id']: row for row in rows_to_dicts(cursor)}.values())
+        finally:
+            cursor.close()
+        for key, values in missing.items():
+            # MySQL compares the keys case-insensitively, so rows are matched back to ids the same way
+            wanted = {}
+            for value in values:
+                wanted.setdefault(value.lower(), []).append(value)
             for row in rows:
-                result = dict(zip(columns, row))
-                result = parse_json_fields(result)
-                results.append(result)
-        else:
-            results = "No results returned or query did not execute successfully."
+                for value in wanted.get(str(row.get(key)).lower(), []):
+                    found[(key, value)].append(row)
+            for value in values:
+                _cache[(cached_fields, key, value)] = found[(key, value)]
+        while len(_cache) > cache_max_entries:
+            _cache.popitem(last=False)
 
-        # Close the cursor and the connection
-        cursor.close()
-        conn.close()
+    return found
 
-    except mysql.connector.Error as e:
+def lookup_page(ids, fields=None, cursor=None, limit=None):
+    """
+    One page of the rows matching any of the ids, in hdp_id order after
+    `cursor`, with the paging done in SQL. Pages are not cached.
+
+    Returns:
+        Tuple of (rows, cursor for the next page or None)
+    """
+    if fields is not None:
+        check_fields(fields, public_fields)
+    columns = list(dict.fromkeys(['hdp_id', *(fields if fields is not None else public_fields)]))
+    lookups = {}
+    for key, value in ids:
+        lookups.setdefault(key, [])
+        if value not in lookups[key]:
+            lookups[key].append(value)
+    query, params = build_page_query(table_name, lookups, columns, cursor, limit)
+    db_cursor = get_connection().cursor()
+    try:
+        db_cursor.execute(query, params)
+        rows = rows_to_dicts(db_cursor)
+    finally:
+        db_cursor.close()
+    if limit is not None and len(rows) > limit:
+        return rows[:limit], rows[limit - 1]['hdp_id']
+    return rows, None
+
+def get_snapshot():
+    """The snapshot at snapshot_path, reopened when the file is replaced; None if there is none."""
+    global _snapshot, _snapshot_stat
+    if not snapshot_path:
+        return None
+    try:
+        stat = os.stat(snapshot_path)
+    except OSError:
+        return None
+    if _snapshot is None or (stat.st_mtime_ns, stat.st_size) != _snapshot_stat:
+        try:
+            snapshot = Snapshot(snapshot_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not open snapshot {snapshot_path}, using the database: {e}")
+            return None
+        if _snapshot is not None:
+            _snapshot.close()
+        _snapshot, _snapshot_stat = snapshot, (stat.st_mtime_ns, stat.st_size)
+    return _snapshot
+
+def snapshot_lookup(snapshot, ids, fields=None):
+    """lookup() answered from the snapshot, decoding each matching document once."""
+    if fields is not None:
+        check_fields(fields, public_fields)
+    decoded = {}
+    found = {}
+    for key, value in ids:
+        numbers = snapshot.numbers(index_key(key, value))
+        for number in numbers:
+            if number not in decoded:
+                decoded[number] = json.loads(snapshot.document(number))
+        found[(key, value)] = [decoded[number] for number in numbers]
+    return found
+
+def snapshot_page(snapshot, ids, fields=None, cursor=None, limit=None):
+    """lookup_page() answered from the snapshot, decoding only the documents on the page."""
+    if fields is not None:
+        check_fields(fields, public_fields)
+    # Documents are stored in hdp_id order, so document numbers sort the same way
+    numbers = sorted({number for key, value in ids for number in snapshot.numbers(index_key(key, value))})
+    if cursor is not None:
+        # Binary search for the first document past the cursor, decoding only the documents it probes
+        low, high = 0, len(numbers)
+        while low < high:
+            middle = (low + high) // 2
+            if json.loads(snapshot.document(numbers[middle]))['hdp_id'] <= cursor:
+                low = middle + 1
+            else:
+                high = middle
+        numbers = numbers[low:]
+    page = numbers if limit is None else numbers[:limit]
+    rows = [json.loads(snapshot.document(number)) for number in page]
+    return rows, (rows[-1]['hdp_id'] if limit is not None and len(numbers) > limit else None)
+
+def snapshot_body(snapshot, ids, batch):
+    """
+    Response body built from the serialized rows in the snapshot, the same JSON
+    lambda_handler builds from query results.
+
+    Args:
+        ids:   list of (parameter, id) as given in the request
+        batch: True for a batch request body, False for query string parameters
+    """
+    def documents(numbers):
+        return "[" + ", ".join(snapshot.document(number).decode('utf-8') for number in numbers) + "]"
+
+    def matching(param, value):
+        return snapshot.numbers(index_key(LOOKUP_KEYS[param], normalize_id(param, value)))
+
+    if batch:
+        groups = {param: {} for param in LOOKUP_KEYS}
+        for param, value in ids:
+            groups[param][value] = documents(matching(param, value))
+        return "{" + ", ".join(
+            f"{json.dumps(param)}: {{" + ", ".join(f"{json.dumps(value)}: {found}" for value, found in matches.items()) + "}"
+            for param, matches in groups.items()) + "}"
+    # Rows are stored in hdp_id order, so document numbers sort the same way
+    return documents(sorted({number for param, value in ids for number in matching(param, value)}))
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, cls=EnhancedEncoder, ensure_ascii=False)
+    if isinstance(value, (Decimal, date)):
+        return EnhancedEncoder().default(value)
+    return value
+
+def format_rows(rows, fmt, columns=None):
+    """
+    NDJSON (one JSON row per line) or CSV body of rows. The CSV header is
+    `columns`, or the columns of the first row.
+    """
+    if fmt == 'ndjson':
+        return "".join(json.dumps(row, cls=EnhancedEncoder) + "\n" for row in rows)
+    columns = columns or (list(rows[0]) if rows else [])
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if columns:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow([csv_value(row[column]) for column in columns])
+    return out.getvalue()
+
+def lambda_handler(event, context):
+    results = []
+    headers = {}
+    if not _configured:
+        configure()
+
+    try:
+        body = json.loads(event['body']) if event.get('body') else None
+        params = event.get('queryStringParameters') or {}
+        batch = isinstance(body, dict)
+        # fields=, format=, limit= and cursor= come from the query string or a batch request body
+        options = {**params, **(body if batch else {})}
+        fields = parse_fields(options.get('fields'))
+        fmt = options.get('format') or 'json'
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}'; expected one of {', '.join(FORMATS)}")
+        limit = int(options['limit']) if options.get('limit') else None
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be a positive integer")
+        cursor = options.get('cursor')
+        snapshot = get_snapshot()
+        # Whole rows as JSON can be sent from the snapshot exactly as stored
+        stored = snapshot is not None and fields is None and fmt == 'json'
+
+        if batch:
+            # Batch mode: {"appl_id": [...], "proj_num": [...], "hdp_id": [...]} in the request body,
+            # answered with the matching rows for every id, keyed by parameter and id
+            if limit is not None or cursor is not None:
+                raise ValueError("limit and cursor page single lookups; they cannot be used in a batch request")
+            ids = [(param, value) for param in LOOKUP_KEYS for value in (body.get(param) or []) if value]
+            if stored:
+                return response(snapshot_body(snapshot, ids, batch=True))
+            keys = [(LOOKUP_KEYS[param], normalize_id(param, value)) for param, value in ids]
+            found = snapshot_lookup(snapshot, keys, fields) if snapshot is not None else lookup(keys, fields)
+            results = {param: {} for param in LOOKUP_KEYS}
+            for param, value in ids:
+                results[param][value] = [project(row, fields) for row in found[(LOOKUP_KEYS[param], normalize_id(param, value))]]
+            if fmt != 'json':
+                # One line per (parameter, id, row)
+                rows = [{'param': param, 'id': value, **row}
+                        for param, matches in results.items() for value, found_rows in matches.items() for row in found_rows]
+                return response(format_rows(rows, fmt, ['param', 'id', *fields] if fields else None), fmt)
+        else:
+            ids = [(param, params[param]) for param in LOOKUP_KEYS if params.get(param)]
+            keys = [(LOOKUP_KEYS[param], normalize_id(param, value)) for param, value in ids]
+            if limit is not None or cursor is not None:
+                # Pages follow hdp_id order; the cursor for the next page is the last hdp_id of this one
+                if snapshot is not None:
+                    rows, next_cursor = snapshot_page(snapshot, keys, fields, cursor, limit)
+                else:
+                    rows, next_cursor = lookup_page(keys, fields, cursor, limit)
+                if next_cursor is not None:
+                    headers['X-Next-Cursor'] = next_cursor
+                results = [project(row, fields) for row in rows]
+            else:
+                if stored:
+                    return response(snapshot_body(snapshot, ids, batch=False))
+                found = snapshot_lookup(snapshot, keys, fields) if snapshot is not None else lookup(keys, fields)
+                # Rows matching any of the ids, once each, in hdp_id order as the UNION query returns them
+                rows = {}
+                for matches in found.values():
+                    for row in matches:
+                        rows[row['hdp_id']] = row
+                results = [project(rows[hdp_id], fields) for hdp_id in sorted(rows)]
+            if fmt != 'json':
+                return response(format_rows(results, fmt, list(fields) if fields else None), fmt, headers)
+
+    except database_errors() as e:
         results = f"Database error: {e}"
     except Exception as e:
         results = f"Execution error: {e}"
 
+    return response(json.dumps(results, cls=EnhancedEncoder), headers=headers)
+
+def response(body, fmt='json', headers=None):
     return {
         'statusCode': 200,
         'headers': {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
+            "Content-Type": FORMATS[fmt],
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": "X-Next-Cursor",
+            **(headers or {})
         },
-        'body': json.dumps(results, cls=EnhancedEncoder)
+        'body': body
     }
 
 # test = lambda_handler(0, 0)
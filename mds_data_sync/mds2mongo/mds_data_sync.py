@@ -1,103 +1,42 @@
-import requests
+import logging
+import sys
 from pymongo import MongoClient
 import json
 import os
 from dotenv import load_dotenv
 from datetime import datetime
 
-load_dotenv(override=True)
+if __name__ == "__main__":
+    # Run from the repository; shared modules live in <repo>/common
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from mds_fetch import MDS_URL, fetch_mds_pages
+from cedar_schema import CedarSchema
 
-# Define CEDAR fields to be included
-CEDAR_FIELDS = [
-    "data",
-    "study_type",
-    "minimal_info",
-    "data_availability",
-    "metadata_location",
-    "study_translational_focus",
-    "human_subject_applicability",
-    "human_condition_applicability",
-    "human_treatment_applicability"
-]
-
-# Define fields to explicitly exclude
-EXCLUDED_FIELDS = [
-    "metadata_location.data_repositories",
-    "metadata_location.nih_reporter_link",
-    "metadata_location.nih_application_id",
-    "metadata_location.clinical_trials_study_ID",
-    "metadata_location.cedar_study_level_metadata_template_instance_ID"
-]
+load_dotenv(override=True)
 
 def fetch_metadata(url):
-    """Fetch data by chunk from the endpoint."""
-    chunk_size = 1000
-    complete_data = {}
-    for chunk_ind in range(0,10):
-        try:
-            query = f"https://healdata.org/mds/metadata?data=True&limit={chunk_size}&offset={chunk_ind*chunk_size}"
-            print(f'Query: {query}')
-            response = requests.get(f"{query}")
-            response.raise_for_status()
-            response_json = response.json()
-            print(len(response_json))
-            if len(response_json) == 0:
-                print("No more data from MDS")
-                break
-            complete_data.update(response_json)
-        except Exception as e:
-            print(f"Error fetching the data for offset: {chunk_ind*chunk_size}, skipping this chunk")
-            continue
+    """Fetch all pages from the endpoint concurrently over a pooled session."""
+    complete_data = fetch_mds_pages(base_url=url)
     print(f"Fetched {len(complete_data)} data elements from the MDS")
     print("--- Finished")
-    return list(complete_data.values()) if isinstance(complete_data, dict) else complete_data
-
-def calculate_cedar_completion(doc):
-    """Calculate the number of completed CEDAR form fields, but set completion percentage to 0% if unregistered."""
-    gen3_discovery = doc.get("gen3_discovery", {})
-    
-    # Check registration status
-    is_registered = gen3_discovery.get("is_registered", False)
-
-    # Extract study metadata
-    cedar_metadata = gen3_discovery.get("study_metadata", {})
-    total_fields = 0
-    completed_fields = 0
-    missing_fields = []
-
-    for section, fields in cedar_metadata.items():
-        if section in CEDAR_FIELDS:
-            if isinstance(fields, dict):  # If section is a dictionary, iterate through its fields
-                for field_name, value in fields.items():
-                    full_field_name = f"{section}.{field_name}"
-                    
-                    # Skip excluded fields
-                    if full_field_name in EXCLUDED_FIELDS:
-                        continue
-                    
-                    total_fields += 1
-                    
-                    # Field is considered completed if it's not empty, not "0", and not NaN
-                    if value not in ["", None, "0"]:
-                        completed_fields += 1
-                    else:
-                        missing_fields.append(full_field_name)  # Track missing fields for debugging
-
-    # Calculate the completion percentage but set it to 0% if unregistered
-    completion_percentage = 0 if not is_registered else round((completed_fields / total_fields) * 100, 2) if total_fields > 0 else 0
-
-    return completed_fields, total_fields, completion_percentage, missing_fields
+    return list(complete_data.values())
 
 def process_data(data):
     """Process data to extract and compute CEDAR form completion stats."""
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    for doc in data:
-        completed, total, percent, missing = calculate_cedar_completion(doc)
-        doc["cedar_completed_fields"] = completed
-        doc["cedar_total_fields"] = total
-        doc["cedar_completion_percent"] = percent  # Always 0% if unregistered
-        doc["cedar_missing_fields"] = missing  # (Optional) Store missing fields for validation/debugging
+    # Completion is scored for the whole batch with the rules the MySQL sync uses (common/cedar_schema.py)
+    completion = CedarSchema.from_records(data).evaluate_records(data)
+    completed = completion.completed
+    percent = completion.percent
+
+    for row, doc in enumerate(data):
+        # Set completion percentage to 0% if unregistered
+        is_registered = (doc.get("gen3_discovery") or {}).get("is_registered", False)
+        doc["cedar_completed_fields"] = int(completed[row])
+        doc["cedar_total_fields"] = completion.total
+        doc["cedar_completion_percent"] = float(percent[row]) if is_registered else 0  # Always 0% if unregistered
+        doc["cedar_missing_fields"] = completion.missing_fields(row)  # (Optional) Store missing fields for validation/debugging
         doc["cedar_last_updated"] = now  # Timestamp for last update
     return data
 
@@ -124,8 +63,10 @@ def save_to_mongodb(data, mongo_uri, db_name, collection_name):
         client.close()
 
 def main():
+    logging.basicConfig(level=logging.INFO)
+
     # Define parameters
-    endpoint = "https://healdata.org/mds/metadata?data=True&limit=12000"
+    endpoint = os.getenv("MDS_BASE_URL", MDS_URL)
     mongo_uri = os.getenv("MONGODB_ATLAS_SRV")
     db_name = os.getenv("MONGODB_DB_NAME")
     collection_name = os.getenv("MONGODB_SNAPSHOT_COLLECTION")
@@ -1,18 +1,52 @@
 import os
+import sys
 import json
-from sqlalchemy import create_engine
-import mysql.connector
+from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 import logging
+
+# Shared modules live in <repo>/common; the deployment package ships them next to this handler
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from db_engine import get_engine
 from mds_data_prep import mds_data_prep
+from progress_tracker_load import export_snapshot, rollback_progress_tracker, sync_progress_tracker
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # https://docs.aws.amazon.com/lambda/latest/dg/python-package.html
 
+def export_table_snapshot(engine, table_name):
+    # Snapshot of the table for the query API to serve lookups from without the database
+    snapshot_path = os.getenv('PROGRESS_TRACKER_SNAPSHOT_PATH')
+    if snapshot_path:
+        try:
+            export_snapshot(engine, table_name, snapshot_path)
+        except (SQLAlchemyError, OSError) as e:
+            print(f'Unsuccessful snapshot export. Error: {e}')
+
+# Invoked with {"action": "rollback"}: undo the last sync or reload of the table instead of syncing
+def rollback_handler():
+    load_dotenv()
+    table_name = os.getenv('TABLE_NAME')
+    engine = get_engine()
+
+    try:
+        undone = rollback_progress_tracker(engine, table_name)
+    except (SQLAlchemyError, ValueError) as e:
+        print(f'Unsuccessful rollback. Error: {e}')
+        return {'statusCode': 500, 'result': json.dumps({'error': str(e)})}
+    print(f"Rolled back the last {undone} of {table_name}")
+
+    # The snapshot follows the restored rows
+    export_table_snapshot(engine, table_name)
+    return {'statusCode': 200, 'result': json.dumps({'undone': undone})}
+
 def lambda_handler(event, context):
 
+    if isinstance(event, dict) and event.get('action') == 'rollback':
+        return rollback_handler()
+
     # Pull data from MDS, and prepare for MySQL upload
     insert_df = mds_data_prep(local=False)
 
@@ -21,63 +55,43 @@ def lambda_handler(event, context):
     load_dotenv()
 
     # Accessing variables
-    db_username = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD')
-    db_host = os.getenv('DB_HOST')
-    db_database = os.getenv('DB_NAME')
     table_name = os.getenv('TABLE_NAME')
 
-    # Drop existing records
-    connection = mysql.connector.connect(
-        host=db_host,
-        database=db_database,
-        user=db_username,
-        password=db_password
-    )
-    cursor = connection.cursor()
-    # SQLAlchemy engine for MySQL
-    engine_url = f'mysql+pymysql://{db_username}:{db_password}@{db_host}/{db_database}'
-    engine = create_engine(engine_url)
-
-    # Insert DataFrame into MySQL table
+    # SQLAlchemy engine for MySQL, kept across warm invocations
+    engine = get_engine()
+
+    # Write only the studies that changed since the last run; the first run, or a change to
+    # progress_tracker_dd.csv, bulk loads a staging table and swaps it in for the live table
     try:
-        insert_df.to_sql(table_name, con=engine, if_exists='replace', index=False)
+        sync_progress_tracker(engine, insert_df, table_name)
         print("Success!")
-    except sqlalchemy.exc.SQLAlchemyError as e:
+    except (SQLAlchemyError, ValueError) as e:
         print(f'Unsuccessful insert. Error: {e}')
 
-    # Update non-registered studies to have 0% completion
-    try:
-        cursor.execute(f"update {table_name} set overall_percent_complete='0' where is_registered ='not registered';")
-        connection.commit()  # Commit the transaction to apply the changes
-        print("unregistered studies zeroed out")
-    except mysql.connector.Error as err:
-        print("unsuccessful update, error:", err)
-
+    export_table_snapshot(engine, table_name)
 
-    # Update non-registered studies to have 0% completion
+    # Spot check a few studies
+    results = []
     try:
-        cursor.execute(f"select appl_id, is_registered, overall_percent_complete  from progress_tracker where appl_id in ('10056337', '9608089', '9867358', '9900258', '10320676', '9839124', '10304570');")
-        # Fetch the results
-        rows = cursor.fetchall()
+        with engine.connect() as conn:
+            result = conn.exec_driver_sql(f"select appl_id, is_registered, overall_percent_complete  from progress_tracker where appl_id in ('10056337', '9608089', '9867358', '9900258', '10320676', '9839124', '10304570');")
+            # Fetch the results
+            rows = result.fetchall()
 
-        # Get column names
-        column_names = [column[0] for column in cursor.description]
+            # Get column names
+            column_names = list(result.keys())
 
         # Convert results to a list of dictionaries
         results = [dict(zip(column_names, row)) for row in rows]
 
         # Convert to JSON and pretty print
-        print(json.dumps(results, indent=4))
-
-    except mysql.connector.Error as err:
-        print("unsuccessful update, error:", err)
+        print(json.dumps(results, indent=4, default=str))
 
-    finally:
-        cursor.close()
+    except SQLAlchemyError as err:
+        print("unsuccessful spot check, error:", err)
 
     response = {
         'statusCode': 200,
-        'result': json.dumps(results, indent=4)
+        'result': json.dumps(results, indent=4, default=str)
         }
-    return response
\ No newline at end of file
+    return response
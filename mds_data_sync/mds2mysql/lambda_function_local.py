@@ -1,8 +1,14 @@
 import logging
+import os
+import sys
+
+# Shared modules live in <repo>/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
 from mds_data_prep import mds_data_prep
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
+logging.basicConfig(level=logging.INFO)
 
 # https://docs.aws.amazon.com/lambda/latest/dg/python-package.html
 
@@ -0,0 +1,552 @@
+"""
+Bulk loader for the progress_tracker table.
+
+The prepared frame is written to a temporary tab-separated file and loaded
+with `LOAD DATA LOCAL INFILE`, the way the scripts in mysql_code/sql_scripts
+load their tables by hand. If the server or client does not allow local
+infile, the rows are sent as multi-row INSERTs in batches instead. Either way
+the table is created from the declared schema (progress_tracker_dd.csv), not
+inferred by pandas. The frame is written exactly as mds_data_prep prepared it;
+business rules such as zeroing unregistered studies are applied there, so a
+load is a single write with no follow-up UPDATE.
+
+Rows are loaded into `<table>_staging`, which is built with its primary key
+and indexes, and then switched in with one atomic `RENAME TABLE`, so readers
+of `<table>` see either the old rows or the new ones, never an empty or
+partly loaded table. The table that was replaced is kept as
+`<table>_previous`; rollback_progress_tracker swaps it back.
+
+Once the table exists with the declared columns, sync_progress_tracker only
+writes what changed: it compares the row_hash of every study with the one
+stored in the table and applies the inserted, updated and deleted hdp_ids as
+batched `INSERT ... ON DUPLICATE KEY UPDATE` and `DELETE` statements in one
+transaction. Unchanged rows are not written at all, so a row's
+date_last_mds_update is the time of the last sync that inserted or changed
+it; the time of the last sync run, whether or not it changed any rows, is
+kept in `table_versions.synced_at`. A full staging reload is done on the
+first run, when the schema changes, or when MDS_FULL_RELOAD is set.
+
+In the same transaction as its changes, a sync saves the rows it is about to
+update or delete, and the keys of the rows it inserts, in `<table>_changes`
+under a new sync_run number, so what it saves grows with the changes and not
+with the table. rollback_progress_tracker undoes the latest saved sync from
+these pre-images, one sync per call, and once none are left swaps
+`<table>_previous` back in. A full reload empties `<table>_changes`, since
+the pre-images of the old table do not apply to the new one. Operators run a
+rollback by invoking lambda_function with `{"action": "rollback"}`.
+
+After every load, sync or rollback the table's version stamp in
+`table_versions` is set to a hash of its row hashes and their latest
+date_last_mds_update, so it changes with the rows and a sync that changes
+nothing keeps it. The query API uses it to tell when its cached lookups are
+stale. Next to it, `schema_version` records a hash of the data dictionary
+the table was created from; when progress_tracker_dd.csv changes a column's
+type, length, missing value or index, the next sync sees a different hash
+and reloads through the staging table instead of syncing rows into the old
+definition. Rolling back a reload clears it, since the restored table may
+have another definition, so the next sync is a reload.
+
+export_snapshot writes the rows of the table, serialized the way the query
+API returns them, to an indexed snapshot file (common/json_snapshot.py) keyed
+by the generated lookup key columns, so the API can answer from the file
+without a database connection.
+
+LOAD DATA only warns about values it truncates or rows it skips, so the
+load is rolled back with ValueError if it leaves warnings. apply_schema has
+already truncated overlong values and dropped repeated keys, with a logged
+warning, so both load paths write the same rows.
+
+The engine must be created with `connect_args={'local_infile': True}` for the
+LOAD DATA path to be tried.
+
+Environment variables:
+    MDS_LOAD_METHOD:     `infile` (default, falls back to `insert`) or `insert`
+    MDS_LOAD_BATCH_SIZE: Rows per INSERT or DELETE batch (default 1000)
+    MDS_FULL_RELOAD:     Set to 1/true/yes to reload every row instead of
+                         syncing changes
+    PROGRESS_TRACKER_SNAPSHOT_PATH:
+                         File lambda_function writes the snapshot to after a
+                         sync; unset for none
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
+
+from json_snapshot import index_key, write_snapshot
+from progress_tracker_columns import INTERNAL_COLUMNS
+from progress_tracker_schema import HASH_COLUMN, SYNC_TIME_COLUMN, changes_definition, load_schema, table_definition
+
+DEFAULT_BATCH_SIZE = 1000
+STAGING_SUFFIX = '_staging'
+PREVIOUS_SUFFIX = '_previous'
+CHANGES_SUFFIX = '_changes'
+VERSION_TABLE = 'table_versions'
+
+
+def quote_name(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def create_table(conn, table_name: str, schema: list = None):
+    """Drop `table_name` if it exists and create it with the declared column types and indexes."""
+    table = table_definition(table_name, schema)
+    table.drop(conn, checkfirst=True)
+    table.create(conn)
+
+
+def swap_tables(conn, table_name: str):
+    """
+    Atomically replace `table_name` with its staging table, keeping the old
+    one as the previous version.
+    """
+    live = quote_name(table_name)
+    staging = quote_name(table_name + STAGING_SUFFIX)
+    previous = quote_name(table_name + PREVIOUS_SUFFIX)
+    if inspect(conn).has_table(table_name):
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {previous}")
+        conn.exec_driver_sql(f"RENAME TABLE {live} TO {previous}, {staging} TO {live}")
+    else:
+        conn.exec_driver_sql(f"RENAME TABLE {staging} TO {live}")
+
+
+def create_changes_table(conn, table_name: str, schema: list, replace: bool = False):
+    """
+    Create the table the syncs of `table_name` save their pre-images in; with
+    `replace`, empty it too.
+    """
+    changes = changes_definition(table_name + CHANGES_SUFFIX, schema)
+    if replace:
+        changes.drop(conn, checkfirst=True)
+    changes.create(conn, checkfirst=True)
+
+
+def save_pre_images(conn, table_name: str, key: str, existing: list, inserted: list, schema: list,
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Save the rows a sync is about to change in `<table>_changes`, under a new
+    sync_run: a copy of the `existing` rows it updates or deletes, and the
+    keys of the rows it inserts, which did not exist before it.
+
+    Returns:
+        The sync_run number.
+    """
+    changes = quote_name(table_name + CHANGES_SUFFIX)
+    run = conn.exec_driver_sql(f"SELECT COALESCE(MAX(sync_run), 0) + 1 FROM {changes}").scalar()
+    # Generated columns are recomputed by MySQL and are not saved
+    columns = ", ".join(quote_name(col.name) for col in schema if not col.expression)
+    for start in range(0, len(existing), batch_size):
+        batch = existing[start:start + batch_size]
+        conn.exec_driver_sql(f"INSERT INTO {changes} (sync_run, existed, {columns}) "
+                             f"SELECT %s, 1, {columns} FROM {quote_name(table_name)} "
+                             f"WHERE {quote_name(key)} IN ({', '.join(['%s'] * len(batch))})", (run, *batch))
+    for start in range(0, len(inserted), batch_size):
+        conn.exec_driver_sql(f"INSERT INTO {changes} (sync_run, existed, {quote_name(key)}) VALUES (%s, 0, %s)",
+                             [(run, value) for value in inserted[start:start + batch_size]])
+    return run
+
+
+def rollback_progress_tracker(engine, table_name: str, schema: list = None) -> str:
+    """
+    Undo the last run that changed `table_name`.
+
+    A sync is undone from the pre-images it saved in `<table>_changes`: the
+    rows it inserted are deleted and the rows it updated or deleted are put
+    back, in one transaction. Each rollback undoes one more sync, back to the
+    last full reload; a reload is undone by swapping `<table>_previous` back
+    in, the table it replaced.
+
+    Returns:
+        `sync` or `reload`, the kind of run that was undone.
+    """
+    schema = schema if schema is not None else load_schema()
+    key = quote_name(_primary_key(schema))
+    live = quote_name(table_name)
+    changes = quote_name(table_name + CHANGES_SUFFIX)
+    with engine.begin() as conn:
+        create_version_table(conn)
+        run = None
+        if inspect(conn).has_table(table_name + CHANGES_SUFFIX):
+            run = conn.exec_driver_sql(f"SELECT MAX(sync_run) FROM {changes}").scalar()
+    if run is not None:
+        columns = ", ".join(quote_name(col.name) for col in schema if not col.expression)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DELETE FROM {live} WHERE {key} IN "
+                                 f"(SELECT {key} FROM {changes} WHERE sync_run = %s)", (run,))
+            conn.exec_driver_sql(f"INSERT INTO {live} ({columns}) SELECT {columns} FROM {changes} "
+                                 "WHERE sync_run = %s AND existed = 1", (run,))
+            conn.exec_driver_sql(f"DELETE FROM {changes} WHERE sync_run = %s", (run,))
+            hashes = conn.exec_driver_sql(f"SELECT {quote_name(HASH_COLUMN)} FROM {live}").scalars().all()
+            # The sync did not change the definition, so the next one can sync rows again
+            write_version(conn, table_name, table_version(hashes, latest_sync_time(conn, table_name)),
+                          stored_schema_version(conn, table_name))
+        print(f"Rolled {table_name} back to before sync run {run}")
+        return 'sync'
+
+    staging = quote_name(table_name + STAGING_SUFFIX)
+    previous = quote_name(table_name + PREVIOUS_SUFFIX)
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(table_name + PREVIOUS_SUFFIX):
+            raise ValueError(f"No previous version of {table_name} to roll back to")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {staging}")
+        conn.exec_driver_sql(f"RENAME TABLE {live} TO {staging}, {previous} TO {live}, {staging} TO {previous}")
+        hashes = conn.exec_driver_sql(f"SELECT {quote_name(HASH_COLUMN)} FROM {live}").scalars().all()
+        # The restored table may have been created from another data dictionary
+        write_version(conn, table_name,
+                      table_version((hash_ or '' for hash_ in hashes), latest_sync_time(conn, table_name)), None)
+    print(f"Rolled {table_name} back to its previous version")
+    return 'reload'
+
+
+def table_version(hashes, synced_at=None) -> str:
+    """
+    Version stamp of a table: MD5 of its row hashes in sorted order and the
+    time of the last sync that wrote any of them.
+    """
+    return hashlib.md5((''.join(sorted(hashes)) + ('' if synced_at is None else str(synced_at))).encode()).hexdigest()
+
+
+def sync_time(df: pd.DataFrame):
+    """The sync time the frame was prepared with, or None."""
+    if SYNC_TIME_COLUMN not in df or not df[SYNC_TIME_COLUMN].notna().any():
+        return None
+    return df[SYNC_TIME_COLUMN].max().to_pydatetime()
+
+
+def schema_version(schema: list) -> str:
+    """MD5 of the declared columns: names, types, missing values, identifiers and expressions."""
+    return hashlib.md5(json.dumps([list(col) for col in schema]).encode()).hexdigest()
+
+
+# Columns of table_versions added after it was first created
+_VERSION_COLUMNS = {'schema_version': 'VARCHAR(32) NULL', 'synced_at': 'DATETIME NULL'}
+
+
+def create_version_table(conn):
+    # DDL commits the open transaction in MySQL, so this is run before a load starts
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {quote_name(VERSION_TABLE)} ("
+        "table_name VARCHAR(64) NOT NULL PRIMARY KEY, version VARCHAR(32) NOT NULL, updated_at DATETIME NOT NULL, "
+        "schema_version VARCHAR(32) NULL, synced_at DATETIME NULL)"
+    )
+    existing = {col['name'] for col in inspect(conn).get_columns(VERSION_TABLE)}
+    for name, definition in _VERSION_COLUMNS.items():
+        if name not in existing:
+            conn.exec_driver_sql(f"ALTER TABLE {quote_name(VERSION_TABLE)} ADD COLUMN {name} {definition}")
+
+
+def write_version(conn, table_name: str, version: str, schema_hash: str = None, synced_at=None):
+    """
+    Record the version stamp of `table_name`, the schema_version of the data
+    dictionary it was built from (None if unknown) and the time of the sync
+    run (None for a rollback) in table_versions.
+    """
+    conn.exec_driver_sql(
+        f"INSERT INTO {quote_name(VERSION_TABLE)} (table_name, version, updated_at, schema_version, synced_at) "
+        "VALUES (%s, %s, UTC_TIMESTAMP(), %s, %s) "
+        "ON DUPLICATE KEY UPDATE version = VALUES(version), updated_at = VALUES(updated_at), "
+        "schema_version = VALUES(schema_version), synced_at = VALUES(synced_at)",
+        (table_name, version, schema_hash, synced_at),
+    )
+
+
+def latest_sync_time(conn, table_name: str):
+    """
+    Latest date_last_mds_update in `table_name`: the time of the last sync
+    that wrote any of its rows.
+    """
+    return conn.exec_driver_sql(f"SELECT MAX({quote_name(SYNC_TIME_COLUMN)}) FROM {quote_name(table_name)}").scalar()
+
+
+def stored_schema_version(conn, table_name: str):
+    """schema_version recorded for `table_name`, or None."""
+    return conn.exec_driver_sql(f"SELECT schema_version FROM {quote_name(VERSION_TABLE)} WHERE table_name = %s",
+                                (table_name,)).scalar()
+
+
+def _tsv_field(values: pd.Series) -> pd.Series:
+    # LOAD DATA's default escaping: \N for NULL, backslash escapes inside values
+    if pd.api.types.is_datetime64_any_dtype(values):
+        text = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        text = values.astype(object).map(str, na_action='ignore')
+        text = (text.str.replace('\\', '\\\\', regex=False)
+                    .str.replace('\t', '\\t', regex=False)
+                    .str.replace('\n', '\\n', regex=False)
+                    .str.replace('\r', '\\r', regex=False)
+                    .str.replace('\0', '\\0', regex=False))
+    return text.where(values.notna(), '\\N')
+
+
+def write_tsv(df: pd.DataFrame, path: str):
+    """Write `df` as a headerless TSV that LOAD DATA reads with its default options."""
+    fields = pd.DataFrame({col: _tsv_field(df[col]) for col in df.columns}, index=df.index)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for row in fields.itertuples(index=False, name=None):
+            f.write('\t'.join(row))
+            f.write('\n')
+
+
+def load_infile(conn, table_name: str, df: pd.DataFrame):
+    fd, path = tempfile.mkstemp(suffix='.tsv')
+    os.close(fd)
+    try:
+        write_tsv(df, path)
+        columns = ", ".join(quote_name(col) for col in df.columns)
+        conn.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quote_name(table_name)} "
+            f"CHARACTER SET utf8mb4 ({columns})"
+        )
+    finally:
+        os.remove(path)
+    check_warnings(conn, table_name)
+
+
+def check_warnings(conn, table_name: str):
+    """
+    Raise ValueError if the last statement left warnings. LOAD DATA LOCAL
+    truncates, converts or skips rows it cannot store and only warns, where the
+    same rows make an INSERT fail; the load is rolled back either way.
+    """
+    warnings = conn.exec_driver_sql("SHOW WARNINGS LIMIT 10").fetchall()
+    if warnings:
+        raise ValueError(f"Loading {table_name} left warnings: " + "; ".join(str(row[2]) for row in warnings))
+
+
+def load_batches(conn, table_name: str, df: pd.DataFrame, batch_size: int = DEFAULT_BATCH_SIZE, upsert: bool = False):
+    """
+    Insert `df` in multi-row INSERT batches of `batch_size` rows; with `upsert`,
+    rows whose key already exists are updated in place.
+    """
+    columns = ", ".join(quote_name(col) for col in df.columns)
+    placeholders = ", ".join(["%s"] * len(df.columns))
+    statement = f"INSERT INTO {quote_name(table_name)} ({columns}) VALUES ({placeholders})"
+    if upsert:
+        statement += " ON DUPLICATE KEY UPDATE " + ", ".join(
+            f"{quote_name(col)} = VALUES({quote_name(col)})" for col in df.columns)
+    rows = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+    # A list of rows is sent with the driver's executemany, which PyMySQL turns into one multi-row
+    # INSERT; going through SQLAlchemy wraps driver errors in SQLAlchemyError
+    for start in range(0, len(rows), batch_size):
+        conn.exec_driver_sql(statement, rows[start:start + batch_size])
+
+
+def delete_batches(conn, table_name: str, key: str, ids: list, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Delete the rows whose `key` is in `ids`, `batch_size` ids per DELETE."""
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        conn.exec_driver_sql(f"DELETE FROM {quote_name(table_name)} WHERE {quote_name(key)} IN "
+                             f"({', '.join(['%s'] * len(batch))})", tuple(batch))
+
+
+def load_progress_tracker(engine, df: pd.DataFrame, table_name: str, method: str = None,
+                          batch_size: int = None, schema: list = None) -> dict:
+    """
+    Load the rows of `df` into a fresh staging table and swap it in for `table_name`.
+
+    Args:
+        engine:     SQLAlchemy engine for the target database.
+        df:         Frame from mds_data_prep, already coerced with apply_schema.
+        table_name: Table to replace.
+        method:     `infile` or `insert`; defaults to $MDS_LOAD_METHOD, then `infile`.
+        batch_size: Rows per INSERT batch; defaults to $MDS_LOAD_BATCH_SIZE, then 1000.
+
+    Returns:
+        Dict with the method used, rows loaded, seconds and rows_per_sec.
+    """
+    schema = schema if schema is not None else load_schema()
+    method = method or os.getenv('MDS_LOAD_METHOD', 'infile')
+    batch_size = batch_size or int(os.getenv('MDS_LOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    if method not in ('infile', 'insert'):
+        raise ValueError(f"Unknown load method '{method}'; expected 'infile' or 'insert'")
+    staging = table_name + STAGING_SUFFIX
+    start = time.perf_counter()
+
+    if method == 'infile':
+        try:
+            with engine.begin() as conn:
+                create_version_table(conn)
+                create_table(conn, staging, schema)
+                load_infile(conn, staging, df)
+        except DBAPIError as e:
+            # e.g. local_infile disabled on the server or the client
+            print(f"LOAD DATA LOCAL INFILE failed, falling back to batched inserts: {e.orig}")
+            method = 'insert'
+
+    if method == 'insert':
+        with engine.begin() as conn:
+            create_version_table(conn)
+            create_table(conn, staging, schema)
+            load_batches(conn, staging, df, batch_size)
+
+    with engine.begin() as conn:
+        swap_tables(conn, table_name)
+        # Pre-images saved by earlier syncs do not apply to the new rows; undoing this load swaps the old table back
+        create_changes_table(conn, table_name, schema, replace=True)
+        write_version(conn, table_name, table_version(df[HASH_COLUMN], sync_time(df)), schema_version(schema),
+                      sync_time(df))
+
+    seconds = time.perf_counter() - start
+    stats = {
+        'method': method,
+        'rows': len(df),
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(len(df) / seconds, 1) if seconds > 0 else float('inf'),
+    }
+    print(f"Loaded {stats['rows']} rows into {table_name} with {method} in {stats['seconds']}s "
+          f"({stats['rows_per_sec']} rows/sec)")
+    return stats
+
+
+def _primary_key(schema: list) -> str:
+    return next(col.name for col in schema if col.identifier == 'PK')
+
+
+def current_hashes(conn, table_name: str, schema: list):
+    """
+    Key -> row_hash of the rows in `table_name`, or None if the table does not
+    exist, its columns are not the declared ones, or it was not built from the
+    current data dictionary (see schema_version).
+    """
+    if not inspect(conn).has_table(table_name):
+        return None
+    if {col['name'] for col in inspect(conn).get_columns(table_name)} != {col.name for col in schema}:
+        return None
+    if stored_schema_version(conn, table_name) != schema_version(schema):
+        return None
+    key = _primary_key(schema)
+    rows = conn.exec_driver_sql(f"SELECT {quote_name(key)}, {quote_name(HASH_COLUMN)} FROM {quote_name(table_name)}").fetchall()
+    return pd.Series([row[1] for row in rows], index=[row[0] for row in rows], dtype=object)
+
+
+def sync_progress_tracker(engine, df: pd.DataFrame, table_name: str, batch_size: int = None,
+                          schema: list = None, full: bool = None) -> dict:
+    """
+    Bring `table_name` in line with `df`, writing only the rows that changed.
+
+    Args:
+        engine:     SQLAlchemy engine for the target database.
+        df:         Frame from mds_data_prep, already coerced with apply_schema.
+        table_name: Table to sync.
+        batch_size: Rows per INSERT or DELETE batch; defaults to
+                    $MDS_LOAD_BATCH_SIZE, then 1000.
+        full:       Reload every row through the staging table; defaults to
+                    $MDS_FULL_RELOAD.
+
+    Returns:
+        Dict with the counts of inserted, updated, deleted and unchanged rows,
+        plus the method, seconds and rows_per_sec of the write.
+    """
+    schema = schema if schema is not None else load_schema()
+    batch_size = batch_size or int(os.getenv('MDS_LOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    if full is None:
+        full = os.getenv('MDS_FULL_RELOAD', '').lower() in ('1', 'true', 'yes')
+
+    current = None
+    if not full:
+        with engine.begin() as conn:
+            create_version_table(conn)
+            current = current_hashes(conn, table_name, schema)
+            if current is not None:
+                # DDL commits in MySQL, so the table is created before the sync's transaction
+                create_changes_table(conn, table_name, schema)
+    if current is None:
+        print(f"Reloading every row of {table_name}")
+        stats = load_progress_tracker(engine, df, table_name, batch_size=batch_size, schema=schema)
+        stats.update({'inserted': len(df), 'updated': 0, 'deleted': 0, 'unchanged': 0})
+        return stats
+
+    start = time.perf_counter()
+    key = _primary_key(schema)
+    new = pd.Series(df[HASH_COLUMN].to_numpy(), index=df[key].to_numpy())
+    existing = new.index.isin(current.index)
+    changed = existing & (new.to_numpy() != current.reindex(new.index).to_numpy())
+    deleted = current.index[~current.index.isin(new.index)].tolist()
+    upserts = df[~existing | changed]
+
+    with engine.begin() as conn:
+        if len(upserts) or deleted:
+            # Only the rows this sync changes are saved, in its own transaction, for rollback_progress_tracker
+            save_pre_images(conn, table_name, key, new.index[changed].tolist() + deleted,
+                            new.index[~existing].tolist(), schema, batch_size)
+        load_batches(conn, table_name, upserts, batch_size, upsert=True)
+        delete_batches(conn, table_name, key, deleted, batch_size)
+        # Only the upserted rows carry this run's time, so a run that changes nothing keeps the version
+        write_version(conn, table_name, table_version(df[HASH_COLUMN], latest_sync_time(conn, table_name)),
+                      schema_version(schema), sync_time(df))
+
+    seconds = time.perf_counter() - start
+    written = len(upserts) + len(deleted)
+    stats = {
+        'method': 'upsert',
+        'inserted': int((~existing).sum()),
+        'updated': int(changed.sum()),
+        'deleted': len(deleted),
+        'unchanged': int((existing & ~changed).sum()),
+        'rows': written,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(written / seconds, 1) if seconds > 0 else float('inf'),
+    }
+    print(f"Synced {table_name} in {stats['seconds']}s: {stats['inserted']} inserted, {stats['updated']} updated, "
+          f"{stats['deleted']} deleted, {stats['unchanged']} unchanged ({stats['rows_per_sec']} rows/sec)")
+    return stats
+
+
+def _json_default(value):
+    # The conversions the query API's EnhancedEncoder makes
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def export_snapshot(engine, table_name: str, path: str, schema: list = None) -> dict:
+    """
+    Write every row of `table_name` to a snapshot file for the query API.
+
+    Each row is serialized as the API returns it, with only the public
+    columns (see common/progress_tracker_columns.py), in primary key order,
+    and indexed under the value of every generated INDEX column (the dash-free
+    lookup keys), lowercased as MySQL compares them. The snapshot carries the
+    table's version stamp.
+
+    Returns:
+        Dict with the number of rows and keys written.
+    """
+    schema = schema if schema is not None else load_schema()
+    key = _primary_key(schema)
+    json_columns = [col.name for col in schema if col.kind == 'json']
+    lookup_columns = [col.name for col in schema if col.expression and col.identifier == 'INDEX']
+    public = [col.name for col in schema if col.name not in INTERNAL_COLUMNS and not col.expression]
+    # row_hash and the lookup keys are read for the version stamp and the index, not written out
+    columns = list(dict.fromkeys([*public, HASH_COLUMN, *lookup_columns]))
+
+    with engine.connect() as conn:
+        result = conn.exec_driver_sql(f"SELECT {', '.join(quote_name(column) for column in columns)} "
+                                      f"FROM {quote_name(table_name)}")
+        rows = [dict(zip(columns, row)) for row in result.fetchall()]
+    for row in rows:
+        for column in json_columns:
+            if row[column] is not None:
+                row[column] = json.loads(row[column])
+    rows.sort(key=lambda row: row[key])
+
+    keys = {}
+    for number, row in enumerate(rows):
+        for column in lookup_columns:
+            if row[column] is not None:
+                keys.setdefault(index_key(column, str(row[column])), []).append(number)
+    documents = [json.dumps({column: row[column] for column in public}, default=_json_default) for row in rows]
+    write_snapshot(path, documents, keys,
+                   table_version((row[HASH_COLUMN] or '' for row in rows),
+                                 max((row[SYNC_TIME_COLUMN] for row in rows if row[SYNC_TIME_COLUMN] is not None), default=None)))
+    print(f"Wrote {len(rows)} rows of {table_name} ({len(keys)} lookup keys) to the snapshot {path}")
+    return {'rows': len(rows), 'keys': len(keys)}
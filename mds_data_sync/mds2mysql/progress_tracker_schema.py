@@ -0,0 +1,225 @@
+"""
+Column schema of the progress_tracker table.
+
+progress_tracker_dd.csv declares, for every column mds_data_prep writes, its
+MySQL type (var_fmt_proposed) and the value written when a study has no value
+for it (var_missing; blank means NULL), and marks the primary key and indexed
+columns (identifier: PK or INDEX). A column with a var_expression is a stored
+column generated by MySQL from the others and is not part of the frame. The
+same declaration is used to coerce the combined frame (apply_schema) and to
+create the table (table_definition), so the frame and the table always agree.
+
+The row_hash column is not taken from the frame; apply_schema fills it with a
+hash of the row's other values, leaving out UNHASHED_COLUMNS, so the sync can
+tell which studies changed since the last run.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column as SqlColumn, Computed, Index, MetaData, Table
+from sqlalchemy.types import DECIMAL, INTEGER, JSON, TEXT, VARCHAR, Date, DateTime
+
+logger = logging.getLogger(__name__)
+
+DD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'progress_tracker_dd.csv')
+
+HASH_COLUMN = 'row_hash'
+# Time of the last sync that inserted or changed the row
+SYNC_TIME_COLUMN = 'date_last_mds_update'
+# Different on every run, so they would make every row look changed
+UNHASHED_COLUMNS = [HASH_COLUMN, SYNC_TIME_COLUMN]
+
+# kind is one of text, json, int, decimal, date, datetime; length is the VARCHAR
+# length or DECIMAL precision, scale the DECIMAL scale; missing is None for NULL;
+# identifier is PK, INDEX or None; expression is the SQL a generated column is
+# computed from, or None
+Column = namedtuple('Column', ['name', 'kind', 'length', 'scale', 'missing', 'identifier', 'expression'])
+
+_KINDS = {
+    'varchar': 'text',
+    'char': 'text',
+    'text': 'text',
+    'json': 'json',
+    'int': 'int',
+    'integer': 'int',
+    'decimal': 'decimal',
+    'date': 'date',
+    'datetime': 'datetime',
+}
+
+
+def load_schema(dd_path: str = DD_PATH) -> list:
+    """Read the data dictionary into a list of Columns, in table order."""
+    dd = pd.read_csv(dd_path, dtype=str, keep_default_na=False)
+    schema = []
+    for name, fmt, missing, identifier, expression in zip(dd['var_name'], dd['var_fmt_proposed'], dd['var_missing'],
+                                                          dd['identifier'], dd['var_expression']):
+        fmt = fmt.strip().lower()
+        base = re.sub(r'\(.*\)', '', fmt).strip()
+        if base not in _KINDS:
+            raise ValueError(f"Unknown MySQL type '{fmt}' for column '{name}'")
+        args = [int(arg) for arg in re.findall(r'\d+', fmt)]
+        kind = _KINDS[base]
+        if missing == '':
+            missing = None
+        elif kind == 'int':
+            missing = int(missing)
+        elif kind == 'decimal':
+            missing = float(missing)
+        schema.append(Column(name, kind, args[0] if args else None, args[1] if len(args) > 1 else None, missing,
+                             identifier.strip().upper() or None, expression.strip() or None))
+    return schema
+
+
+def sql_dtype_map(schema: list = None) -> dict:
+    """SQLAlchemy dtype dict for to_sql(dtype=...)."""
+    schema = schema if schema is not None else load_schema()
+    dtype_map = {}
+    for col in schema:
+        if col.kind == 'text':
+            dtype_map[col.name] = VARCHAR(col.length) if col.length else TEXT()
+        elif col.kind == 'json':
+            dtype_map[col.name] = JSON()
+        elif col.kind == 'int':
+            dtype_map[col.name] = INTEGER()
+        elif col.kind == 'decimal':
+            dtype_map[col.name] = DECIMAL(col.length, col.scale)
+        elif col.kind == 'date':
+            dtype_map[col.name] = Date()
+        else:
+            dtype_map[col.name] = DateTime()
+    return dtype_map
+
+
+def table_definition(table_name: str, schema: list = None, metadata: MetaData = None) -> Table:
+    """SQLAlchemy Table with the declared column types, primary key and indexes."""
+    schema = schema if schema is not None else load_schema()
+    dtype_map = sql_dtype_map(schema)
+    columns = [SqlColumn(col.name, dtype_map[col.name], *([Computed(col.expression, persisted=True)] if col.expression else []),
+                         primary_key=col.identifier == 'PK') for col in schema]
+    indexes = [Index(f"ix_{col.name}", col.name) for col in schema if col.identifier == 'INDEX']
+    return Table(table_name, metadata if metadata is not None else MetaData(), *columns, *indexes)
+
+
+def changes_definition(table_name: str, schema: list = None, metadata: MetaData = None) -> Table:
+    """
+    SQLAlchemy Table for the rows a sync saves before changing them: the
+    declared columns other than the generated ones, with no keys, plus the
+    sync_run that saved them and whether the row existed before that run.
+    """
+    schema = schema if schema is not None else load_schema()
+    dtype_map = sql_dtype_map(schema)
+    columns = [SqlColumn(col.name, dtype_map[col.name]) for col in schema if not col.expression]
+    return Table(table_name, metadata if metadata is not None else MetaData(),
+                 SqlColumn('sync_run', INTEGER(), nullable=False), SqlColumn('existed', INTEGER(), nullable=False),
+                 *columns, Index('ix_sync_run', 'sync_run'))
+
+
+def _text(value) -> str:
+    # Whole numbers padded to float by missing rows are written without the .0
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _as_text(values: pd.Series, missing) -> pd.Series:
+    text = values.astype(object).map(_text, na_action='ignore')
+    return text.fillna(missing) if missing is not None else text.where(text.notna(), None)
+
+
+def _as_json(values: pd.Series, missing) -> pd.Series:
+    text = values.astype(object).map(json.dumps, na_action='ignore')
+    return text.fillna(missing) if missing is not None else text.where(text.notna(), None)
+
+
+def _as_number(values: pd.Series, missing, scale=0) -> pd.Series:
+    numbers = pd.to_numeric(values, errors='coerce').round(scale)
+    if missing is not None:
+        numbers = numbers.fillna(missing)
+    return numbers.astype('Int64') if scale == 0 else numbers
+
+
+def _as_datetime(values: pd.Series) -> pd.Series:
+    stamps = pd.to_datetime(values, errors='coerce', utc=True, format='mixed')
+    return stamps.dt.tz_localize(None)
+
+
+def _truncate(values: pd.Series, col: Column, keys: pd.Series) -> pd.Series:
+    # LOAD DATA would truncate these with a warning and an INSERT would fail
+    too_long = values.map(len, na_action='ignore') > col.length
+    if not too_long.any():
+        return values
+    logger.warning("Truncated %d values of %s to VARCHAR(%d) for %s", too_long.sum(), col.name, col.length,
+                   keys[too_long].tolist()[:10])
+    return values.where(~too_long, values.str.slice(0, col.length))
+
+
+def row_hashes(df: pd.DataFrame) -> pd.Series:
+    """MD5 of each row's values, in column order, leaving out UNHASHED_COLUMNS."""
+    values = df.drop(columns=UNHASHED_COLUMNS, errors='ignore').astype(str)
+    return pd.Series([hashlib.md5('\x1f'.join(row).encode()).hexdigest()
+                      for row in values.itertuples(index=False, name=None)], index=df.index, dtype=object)
+
+
+def apply_schema(df: pd.DataFrame, schema: list = None) -> pd.DataFrame:
+    """
+    Coerce a combined progress tracker frame to the declared column types.
+
+    Columns come out in schema order; a declared column the frame does not
+    have is written as missing. Columns the schema does not declare are an
+    error. A declared row_hash column is filled by row_hashes, and generated
+    columns are left for MySQL to fill.
+
+    Values longer than their VARCHAR are truncated and rows repeating a
+    primary key are dropped, keeping the first, each with a logged warning
+    naming the studies. One odd MDS record does not stop the sync, and every
+    load path writes the same rows.
+
+    Returns:
+        A new frame of str (text), serialized JSON str (json), Int64 (int),
+        float64 (decimal), date (date) and datetime64 (datetime) columns.
+    """
+    schema = schema if schema is not None else load_schema()
+    undeclared = [name for name in df.columns if name not in {col.name for col in schema}]
+    if undeclared:
+        raise ValueError(f"Columns missing from the progress_tracker schema: {undeclared}")
+
+    key = next((col.name for col in schema if col.identifier == 'PK'), None)
+    keys = df[key] if key in df else pd.Series(df.index, index=df.index)
+    empty = pd.Series(np.nan, index=df.index, dtype=object)
+    out = {}
+    for col in schema:
+        if col.expression:
+            continue
+        values = df[col.name] if col.name in df else empty
+        if col.kind == 'text':
+            out[col.name] = _as_text(values, col.missing)
+            if col.length:
+                out[col.name] = _truncate(out[col.name], col, keys)
+        elif col.kind == 'json':
+            out[col.name] = _as_json(values, col.missing)
+        elif col.kind == 'int':
+            out[col.name] = _as_number(values, col.missing)
+        elif col.kind == 'decimal':
+            out[col.name] = _as_number(values, col.missing, col.scale)
+        elif col.kind == 'date':
+            out[col.name] = _as_datetime(values).dt.date.astype(object).where(lambda d: d.notna(), None)
+        else:
+            out[col.name] = _as_datetime(values)
+    out = pd.DataFrame(out, index=df.index)
+    if key is not None:
+        # LOAD DATA would keep the first of each and an INSERT would fail
+        repeated = out[key].duplicated()
+        if repeated.any():
+            logger.warning("Dropped %d rows repeating a %s: %s", repeated.sum(), key,
+                           out[key][repeated].unique().tolist()[:10])
+            out = out[~repeated]
+    if HASH_COLUMN in out:
+        out[HASH_COLUMN] = row_hashes(out)
+    return out
@@ -0,0 +1,251 @@
+"""
+Record MDS pages to fixture files and replay them from a local HTTP server.
+
+Recording pulls every page of `/mds/metadata?data=True` and saves it as a
+gzip-compressed page file (the same page-<offset>-<count>.json.gz format the
+fetch checkpoint uses) plus a manifest.json. Replaying serves those records
+on `/mds/metadata` with configurable latency, server-side page-size cap and
+error rates, so that the syncs can be benchmarked and regression-tested
+without network access by pointing them at the server:
+
+    python mds_replay.py record fixtures/mds
+    python mds_replay.py serve fixtures/mds --port 8080 --latency 0.2 --error-rate 0.05
+    MDS_BASE_URL=http://127.0.0.1:8080/mds/metadata python mds2mysql/lambda_function_local.py
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+if __name__ == "__main__":
+    # Run from the repository; shared modules live in <repo>/common
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from mds_fetch import MDS_URL, clear_checkpoint, fetch_mds_pages, list_checkpoint_pages, read_checkpoint_page
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+def record_fixtures(out_dir: str, base_url: str = MDS_URL, page_size: int = None, concurrency: int = None) -> dict:
+    """
+    Capture every MDS page from `base_url` into `out_dir`.
+
+    Returns:
+        The manifest written alongside the pages.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    clear_checkpoint(out_dir)
+    records = fetch_mds_pages(base_url=base_url, page_size=page_size, concurrency=concurrency,
+                              checkpoint_dir=out_dir, checkpoint_ttl=None, keep_checkpoint=True)
+    manifest = {
+        "source": base_url,
+        "recorded_at": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        "records": len(records),
+        "pages": len(list_checkpoint_pages(out_dir)),
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=4)
+    logger.info("Recorded %d records in %d pages to %s", manifest["records"], manifest["pages"], out_dir)
+    return manifest
+
+
+def load_fixture_records(fixture_dir: str) -> list:
+    """
+    Read recorded pages back as a list of (guid, record) pairs in offset
+    order, dropping GUIDs repeated across pages.
+    """
+    records = []
+    seen = set()
+    pages = list_checkpoint_pages(fixture_dir)
+    for offset in sorted(pages):
+        for guid, record in read_checkpoint_page(pages[offset][1]).items():
+            if guid not in seen:
+                seen.add(guid)
+                records.append((guid, record))
+    return records
+
+
+class ReplayServer:
+    """
+    Serves recorded MDS records on `/mds/metadata` the way the MDS does.
+
+    Supports `?data=True&limit=&offset=` (GUID -> record object),
+    `?data=False` (list of GUIDs) and `/mds/metadata/<guid>`.
+
+    Args:
+        records:       List of (guid, record) pairs, e.g. from load_fixture_records.
+        host, port:    Address to listen on; port 0 picks a free port.
+        latency:       Seconds added to every response.
+        jitter:        Extra random delay of up to this many seconds.
+        max_page_size: Cap on `limit`, as the real service applies.
+        error_rate:    Fraction of requests answered with a 502/503/504.
+        truncate_rate: Fraction of responses whose body is cut off half way.
+        seed:          Seed for the latency, error and truncation draws.
+    """
+
+    def __init__(self, records: list, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, max_page_size: int = None, error_rate: float = 0.0,
+                 truncate_rate: float = 0.0, seed: int = None):
+        self.guids = [guid for guid, _ in records]
+        # Records are serialized once up front so each page is a join of byte strings
+        self.encoded = [json.dumps(record).encode() for _, record in records]
+        self.items = [json.dumps(guid).encode() + b":" + body for guid, body in zip(self.guids, self.encoded)]
+        self.index = {guid: i for i, guid in enumerate(self.guids)}
+        self.latency = latency
+        self.jitter = jitter
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.requests_served = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/mds/metadata"
+
+    def _draw(self):
+        with self.random_lock:
+            return self.random.random(), self.random.random(), self.random.random()
+
+    def page_body(self, data: bool, offset: int, limit: int) -> bytes:
+        if self.max_page_size:
+            limit = min(limit, self.max_page_size)
+        if not data:
+            return json.dumps(self.guids[offset:offset + limit]).encode()
+        return b"{" + b",".join(self.items[offset:offset + limit]) + b"}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests_served += 1
+                delay_draw, error_draw, truncate_draw = server._draw()
+                time.sleep(server.latency + server.jitter * delay_draw)
+
+                url = urlparse(self.path)
+                path = url.path.rstrip("/")
+                params = parse_qs(url.query)
+                if error_draw < server.error_rate:
+                    self._send((502, 503, 504)[int(delay_draw * 3) % 3], b'{"detail": "replayed error"}')
+                    return
+
+                if path.endswith("/metadata"):
+                    try:
+                        limit = int(params.get("limit", ["10"])[0])
+                        offset = int(params.get("offset", ["0"])[0])
+                    except ValueError:
+                        self._send(422, b'{"detail": "invalid limit or offset"}')
+                        return
+                    data = params.get("data", ["False"])[0].lower() == "true"
+                    body = server.page_body(data, offset, limit)
+                elif "/metadata/" in path:
+                    guid = path.rsplit("/", 1)[-1]
+                    if guid not in server.index:
+                        self._send(404, b'{"detail": "Not found"}')
+                        return
+                    body = server.encoded[server.index[guid]]
+                else:
+                    self._send(404, b'{"detail": "Not found"}')
+                    return
+                self._send(200, body, truncate=truncate_draw < server.truncate_rate)
+
+            def _send(self, status, body, truncate=False):
+                gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    body = gzip.compress(body, compresslevel=1)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                if truncate:
+                    self.send_header("Connection", "close")
+                self.end_headers()
+                if truncate:
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                else:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("%s - %s", self.address_string(), format % args)
+
+        return Handler
+
+    def start(self) -> str:
+        """Serve from a background thread and return the base URL."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "record":
+        record_fixtures(args.fixture_dir, base_url=args.base_url, page_size=args.page_size,
+                        concurrency=args.concurrency)
+        return
+
+    records = load_fixture_records(args.fixture_dir)
+    server = ReplayServer(records, host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+                          max_page_size=args.max_page_size, error_rate=args.error_rate,
+                          truncate_rate=args.truncate_rate, seed=args.seed)
+    logger.info("Replaying %d records on %s", len(records), server.base_url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record MDS pages to fixtures, or replay them from a local server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Capture /mds/metadata pages to compressed fixture files")
+    record_parser.add_argument('fixture_dir', action="store", help="Directory to write the page files and manifest to")
+    record_parser.add_argument('--base-url', dest="base_url", action="store", default=MDS_URL, help="MDS endpoint to record from")
+    record_parser.add_argument('--page-size', dest="page_size", action="store", type=int, help="Records per recorded page")
+    record_parser.add_argument('--concurrency', dest="concurrency", action="store", type=int, help="Pages to fetch at once")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve recorded fixtures on /mds/metadata")
+    serve_parser.add_argument('fixture_dir', action="store", help="Directory written by the record command")
+    serve_parser.add_argument('--host', dest="host", action="store", default="127.0.0.1")
+    serve_parser.add_argument('--port', dest="port", action="store", type=int, default=8080)
+    serve_parser.add_argument('--latency', dest="latency", action="store", type=float, default=0.0, help="Seconds added to every response")
+    serve_parser.add_argument('--jitter', dest="jitter", action="store", type=float, default=0.0, help="Random extra delay of up to this many seconds")
+    serve_parser.add_argument('--max-page-size', dest="max_page_size", action="store", type=int, help="Cap applied to the limit parameter")
+    serve_parser.add_argument('--error-rate', dest="error_rate", action="store", type=float, default=0.0, help="Fraction of requests answered with a 5xx")
+    serve_parser.add_argument('--truncate-rate', dest="truncate_rate", action="store", type=float, default=0.0, help="Fraction of responses cut off half way")
+    serve_parser.add_argument('--seed', dest="seed", action="store", type=int, help="Random seed for reproducible latency and errors")
+
+    main(parser.parse_args())
@@ -0,0 +1,319 @@
+"""
+Generate synthetic MDS records at a chosen scale for load testing the syncs.
+
+A profile is learned from a real snapshot (fixtures written by
+`mds_replay.py record`, or any saved `{guid: record}` JSON): how often each
+top-level section (`gen3_discovery`, `nih_reporter`, `clinicaltrials_gov`,
+`variable_level_metadata`) and `_guid_type` occur, how often each field and
+each CEDAR `study_metadata` section/field is present, and a sample of real
+values for every field (`data_repositories`, `__manifest`, `tags`, ... are
+sampled whole). Generated records draw each field independently from that
+profile; identifiers are made unique per record so GUID, appl_id and
+project number joins behave as they do on real data.
+
+    python mds_synth.py learn fixtures/mds profile.json
+    python mds_synth.py generate profile.json fixtures/synth-100k --records 100000
+    python mds_synth.py bench profile.json --scales 10000 100000 1000000
+
+Generated fixtures can be served with `mds_replay.py serve`. `bench` runs
+`parse_mds_response` from the MySQL sync over generated records at each scale
+and reports parse time and memory.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+if __name__ == "__main__":
+    # Run from the repository; shared modules live in <repo>/common and mds_data_prep in mds2mysql
+    sys.path += [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'),
+                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mds2mysql')]
+from mds_fetch import DEFAULT_PAGE_SIZE, clear_checkpoint, write_checkpoint_page
+from mds_replay import MANIFEST, load_fixture_records
+
+logger = logging.getLogger(__name__)
+
+SECTIONS = ["gen3_discovery", "nih_reporter", "clinicaltrials_gov", "variable_level_metadata"]
+# Number of example values kept per field
+SAMPLE_SIZE = 200
+
+# Fields that identify a study and must not repeat across generated records
+IDENTIFIERS = {
+    ("gen3_discovery", "appl_id"): lambda i: 90000000 + i,
+    ("gen3_discovery", "project_number"): lambda i: f"1U24DA{i:07d}-01",
+    ("nih_reporter", "appl_id"): lambda i: 90000000 + i,
+    ("nih_reporter", "project_num"): lambda i: f"1U24DA{i:07d}-01",
+    ("clinicaltrials_gov", "NCTId"): lambda i: f"NCT{i:08d}",
+    ("metadata_location", "nih_application_id"): lambda i: 90000000 + i,
+}
+
+
+class _FieldProfile:
+    """Presence count and a reservoir sample of the values seen for one field."""
+
+    def __init__(self):
+        self.count = 0
+        self.values = []
+
+    def add(self, value, rnd: random.Random):
+        self.count += 1
+        if len(self.values) < SAMPLE_SIZE:
+            self.values.append(value)
+        else:
+            slot = rnd.randrange(self.count)
+            if slot < SAMPLE_SIZE:
+                self.values[slot] = value
+
+    def to_dict(self, total: int) -> dict:
+        return {"rate": self.count / total if total else 0.0, "values": self.values}
+
+
+def _profile_fields(profiles: dict, fields: dict, rnd: random.Random, skip=()):
+    for key, value in fields.items():
+        if key not in skip:
+            profiles.setdefault(key, _FieldProfile()).add(value, rnd)
+
+
+def learn_profile(records, seed: int = 0) -> dict:
+    """
+    Learn field distributions from (guid, record) pairs.
+
+    Returns:
+        A JSON-serializable profile for generate_records.
+    """
+    rnd = random.Random(seed)
+    total = 0
+    guid_types = {}
+    registered = {}
+    sections = {name: {"count": 0, "fields": {}} for name in SECTIONS}
+    study_metadata = {}
+    with_study_metadata = 0
+
+    for _, record in records:
+        total += 1
+        guid_type = record.get("_guid_type")
+        if guid_type is not None:
+            guid_types[guid_type] = guid_types.get(guid_type, 0) + 1
+        for name in SECTIONS:
+            if name not in record:
+                continue
+            section = record[name]
+            sections[name]["count"] += 1
+            _profile_fields(sections[name]["fields"], section, rnd, skip=("study_metadata", "is_registered"))
+            if name != "gen3_discovery":
+                continue
+            # Registration is drawn per GUID type, as only discovery_metadata studies are registered
+            counts = registered.setdefault(guid_type or "", [0, 0])
+            counts[0] += 1
+            counts[1] += bool(section.get("is_registered"))
+            if isinstance(section.get("study_metadata"), dict):
+                with_study_metadata += 1
+                for key, fields in section["study_metadata"].items():
+                    entry = study_metadata.setdefault(key, {"count": 0, "fields": {}})
+                    entry["count"] += 1
+                    if isinstance(fields, dict):
+                        _profile_fields(entry["fields"], fields, rnd)
+
+    gen3_count = sections["gen3_discovery"]["count"]
+    return {
+        "records": total,
+        "learned_at": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        "guid_types": {k: v / gen3_count for k, v in guid_types.items()} if gen3_count else {},
+        "registered_rate": {k: v[1] / v[0] for k, v in registered.items()},
+        "sections": {
+            name: {
+                "rate": entry["count"] / total if total else 0.0,
+                "fields": {k: p.to_dict(entry["count"]) for k, p in entry["fields"].items()},
+            }
+            for name, entry in sections.items()
+        },
+        "study_metadata": {
+            "rate": with_study_metadata / gen3_count if gen3_count else 0.0,
+            "sections": {
+                key: {
+                    "rate": entry["count"] / with_study_metadata,
+                    "fields": {k: p.to_dict(entry["count"]) for k, p in entry["fields"].items()},
+                }
+                for key, entry in study_metadata.items()
+            },
+        },
+    }
+
+
+def _draw_fields(fields: dict, rnd: random.Random, section: str, index: int) -> dict:
+    out = {}
+    for key, field in fields.items():
+        if not field["values"] or rnd.random() >= field["rate"]:
+            continue
+        value = rnd.choice(field["values"])
+        make_id = IDENTIFIERS.get((section, key))
+        if make_id is not None and value not in (None, "", [], {}):
+            value = make_id(index) if not isinstance(value, str) else str(make_id(index))
+        out[key] = value
+    return out
+
+
+def generate_records(profile: dict, n: int, seed: int = 0, guid_prefix: str = "HDP"):
+    """
+    Yield `n` synthetic (guid, record) pairs drawn from `profile`.
+
+    Values are shared with the profile's samples rather than copied, so the
+    records must be treated as read-only (serialize them, or deep-copy first).
+    """
+    rnd = random.Random(seed)
+    sections = profile["sections"]
+    guid_types = list(profile["guid_types"].items())
+    study_metadata = profile["study_metadata"]
+    width = max(len(str(n)), 5)
+
+    for i in range(n):
+        record = {}
+        for name in SECTIONS:
+            section = sections.get(name)
+            if not section or rnd.random() >= section["rate"]:
+                continue
+            record[name] = _draw_fields(section["fields"], rnd, name, i)
+
+        gen3 = record.get("gen3_discovery")
+        if gen3 is not None:
+            if guid_types:
+                guid_type = rnd.choices([k for k, _ in guid_types], weights=[w for _, w in guid_types])[0]
+                record["_guid_type"] = guid_type
+            else:
+                guid_type = ""
+            gen3["is_registered"] = rnd.random() < profile["registered_rate"].get(guid_type, 0.0)
+            if rnd.random() < study_metadata["rate"]:
+                gen3["study_metadata"] = {
+                    key: _draw_fields(entry["fields"], rnd, key, i)
+                    for key, entry in study_metadata["sections"].items()
+                    if rnd.random() < entry["rate"]
+                }
+        yield f"{guid_prefix}{i:0{width}d}", record
+
+
+def write_fixtures(profile: dict, out_dir: str, n: int, seed: int = 0, page_size: int = DEFAULT_PAGE_SIZE) -> dict:
+    """
+    Write `n` generated records to `out_dir` in the page format read by
+    mds_replay.load_fixture_records, plus a manifest.json.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    clear_checkpoint(out_dir)
+    page, offset, pages = {}, 0, 0
+    for guid, record in generate_records(profile, n, seed=seed):
+        page[guid] = record
+        if len(page) == page_size:
+            write_checkpoint_page(out_dir, offset, page)
+            offset, pages, page = offset + len(page), pages + 1, {}
+    if page:
+        write_checkpoint_page(out_dir, offset, page)
+        pages += 1
+    manifest = {
+        "source": "synthetic",
+        "profile_records": profile["records"],
+        "seed": seed,
+        "recorded_at": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        "records": n,
+        "pages": pages,
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=4)
+    logger.info("Wrote %d synthetic records in %d pages to %s", n, pages, out_dir)
+    return manifest
+
+
+def bench_parse(profile: dict, scales: list, seed: int = 0, trace_memory: bool = False) -> list:
+    """
+    Time `parse_mds_response` over generated records at each scale.
+
+    Records are round-tripped through JSON first so each run parses its own
+    objects, as it would after a fetch. `max_rss_mb` is the process high-water
+    mark so far (run scales in ascending order); with `trace_memory` the
+    tracemalloc peak of the parse alone is reported as well, at the cost of
+    several times slower timings.
+    """
+    from mds_data_prep import parse_mds_response
+
+    results = []
+    for n in scales:
+        response = json.loads(json.dumps(dict(generate_records(profile, n, seed=seed))))
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        # The sync prints per-GUID progress; keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = parse_mds_response(response)
+        elapsed = time.perf_counter() - start
+        result = {
+            "records": n,
+            "rows": len(df),
+            "columns": len(df.columns),
+            "seconds": round(elapsed, 2),
+            "records_per_sec": round(n / elapsed, 1) if elapsed else None,
+            # ru_maxrss is in kilobytes on Linux
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        if trace_memory:
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+            tracemalloc.stop()
+        logger.info("%(records)d records -> %(rows)d rows in %(seconds).2fs (%(records_per_sec)s records/s), "
+                    "max RSS %(max_rss_mb).1f MB", result)
+        results.append(result)
+        del response, df
+    return results
+
+
+def _load_snapshot(path: str):
+    if os.path.isdir(path):
+        return load_fixture_records(path)
+    with open(path) as f:
+        data = json.load(f)
+    return data.items() if isinstance(data, dict) else data
+
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "learn":
+        profile = learn_profile(_load_snapshot(args.snapshot), seed=args.seed)
+        with open(args.profile, "w") as f:
+            json.dump(profile, f)
+        logger.info("Learned profile from %d records to %s", profile["records"], args.profile)
+        return
+
+    with open(args.profile) as f:
+        profile = json.load(f)
+    if args.command == "generate":
+        write_fixtures(profile, args.fixture_dir, args.records, seed=args.seed, page_size=args.page_size)
+    else:
+        results = bench_parse(profile, sorted(args.scales), seed=args.seed, trace_memory=args.trace_memory)
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learn MDS field distributions and generate synthetic MDS records")
+    parser.add_argument('--seed', dest="seed", action="store", type=int, default=0, help="Random seed")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    learn_parser = subparsers.add_parser("learn", help="Learn a profile from a snapshot")
+    learn_parser.add_argument('snapshot', action="store", help="Fixture directory from mds_replay.py, or a {guid: record} JSON file")
+    learn_parser.add_argument('profile', action="store", help="File to write the profile to")
+
+    generate_parser = subparsers.add_parser("generate", help="Write synthetic records as replayable fixtures")
+    generate_parser.add_argument('profile', action="store", help="Profile written by the learn command")
+    generate_parser.add_argument('fixture_dir', action="store", help="Directory to write the page files and manifest to")
+    generate_parser.add_argument('--records', dest="records", action="store", type=int, required=True, help="Number of GUIDs to generate")
+    generate_parser.add_argument('--page-size', dest="page_size", action="store", type=int, default=DEFAULT_PAGE_SIZE, help="Records per page file")
+
+    bench_parser = subparsers.add_parser("bench", help="Time the MySQL sync's parse at several scales")
+    bench_parser.add_argument('profile', action="store", help="Profile written by the learn command")
+    bench_parser.add_argument('--scales', dest="scales", action="store", type=int, nargs="+", default=[10000, 100000], help="Numbers of GUIDs to parse")
+    bench_parser.add_argument('--trace-memory', dest="trace_memory", action="store_true", help="Also report the tracemalloc peak of each parse (slow)")
+
+    main(parser.parse_args())
@@ -5,6 +5,8 @@ import re
 import logging
 from typing import Tuple
 
+import json_backend
+
 logger = logging.getLogger(__name__)
 
 def process_awards(df: pd.DataFrame, id_type: str, project_id_col: str, project_title_col: str,
@@ -75,8 +77,13 @@ def create_project_num_list_from_df(df: pd.DataFrame, id_type: str, project_id_c
 def post_request(clean_non_utf: bool, id_type: str, project_id_list: list, end_point: str = "projects/search", chunk_length: int = 50):
     """
     Post request to NIH RePORTER API.
+
+    All chunks are posted over one keep-alive session that asks for gzip
+    responses; bodies are decoded with json_backend (orjson when installed),
+    and the transfer and decode times are logged for the whole run.
     """
     results_list = []
+    timing_totals = {"wire_bytes": 0, "bytes": 0, "transfer": 0.0, "decode": 0.0}
 
     if id_type == "appl_id":
         criteria_name = "appl_ids"
@@ -90,8 +97,10 @@ def post_request(clean_non_utf: bool, id_type: str, project_id_list: list, end_p
     url = f"{base_url}{end_point}"
     headers = {
         'Content-Type': 'application/json',
-        'accept': 'application/json'
+        'accept': 'application/json',
+        'Accept-Encoding': json_backend.ACCEPT_ENCODING
     }
+    session = requests.Session()
 
     for i in range(0, len(project_id_list), chunk_length):
         projects = project_id_list[i:i+chunk_length]
@@ -105,7 +114,7 @@ def post_request(clean_non_utf: bool, id_type: str, project_id_list: list, end_p
         }
 
         # Request Object
-        req = requests.post(url, headers=headers, json=request_body)
+        req = session.post(url, headers=headers, json=request_body, stream=True)
         
         # Check if request was successful
         if not req.ok:
@@ -113,7 +122,12 @@ def post_request(clean_non_utf: bool, id_type: str, project_id_list: list, end_p
             continue
         
         try:
-            response = req.json()
+            response, timings = json_backend.read_json_response(req)
+            logger.debug("%s chunk %d: %d wire bytes (%s), %d bytes, transfer %.2fs, decode %.2fs",
+                         end_point, i // chunk_length, timings["wire_bytes"], timings["encoding"],
+                         timings["bytes"], timings["transfer"], timings["decode"])
+            for key in timing_totals:
+                timing_totals[key] += timings[key]
             # Handle both dict response with 'results' key and list response
             if isinstance(response, dict):
                 results_obj = response.get('results', [])
@@ -133,6 +147,10 @@ def post_request(clean_non_utf: bool, id_type: str, project_id_list: list, end_p
 
         results_list.extend(results_obj)
 
+    session.close()
+    logger.info("%s: %d wire bytes for %d body bytes; transfer %.2fs vs %s decode %.2fs",
+                end_point, timing_totals["wire_bytes"], timing_totals["bytes"], timing_totals["transfer"],
+                json_backend.BACKEND, timing_totals["decode"])
     return results_list
 
 def utfy_dict(dic):
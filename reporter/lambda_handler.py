@@ -1,14 +1,17 @@
 import os
 import re
+import sys
 import json
 from datetime import datetime, timezone
-import boto3
-from sqlalchemy import create_engine
 from sqlalchemy import types as sqltypes
 from sqlalchemy.exc import SQLAlchemyError, NoSuchTableError
 from dotenv import load_dotenv
 import pandas as pd
 import logging
+
+# Shared modules live in <repo>/common; the deployment package ships them next to this handler
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from db_engine import get_engine
 from heal_award_segmenter_lib import process_awards, prepare_for_ingest
 
 
@@ -20,6 +23,8 @@ def _notify(topic_arn: str, subject: str, message: str):
     """Publish a plain-text notification to SNS. No-op if no topic ARN is configured."""
     if not topic_arn:
         return
+    # Imported here so runs without a topic never load boto3
+    import boto3
     boto3.client('sns').publish(TopicArn=topic_arn, Subject=subject, Message=message)
 
 # Maps lowercase MySQL type base names to SQLAlchemy types
@@ -78,10 +83,6 @@ def build_sql_dtype_map(dd_path: str, name_col: str = "name", type_col: str = "t
 def lambda_handler(event, context):
     load_dotenv()
 
-    db_username = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD')
-    db_host = os.getenv('DB_HOST')
-    db_database = os.getenv('DB_NAME')
     db_target_tablename = os.getenv('TABLE_NAME', 'reporter_test')
     sns_topic_arn = os.getenv('REPORTER_SNS_TOPIC_ARN')
     _default_dd = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reporter_dd.csv')
@@ -89,8 +90,8 @@ def lambda_handler(event, context):
 
     run_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
 
-    engine_url = f'mysql+pymysql://{db_username}:{db_password}@{db_host}/{db_database}'
-    engine = create_engine(engine_url)
+    # Shared engine, kept across warm invocations
+    engine = get_engine()
 
     try:
         # Read awards table (required)
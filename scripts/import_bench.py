@@ -0,0 +1,119 @@
+"""
+Measure the import (cold start) cost of the Lambda handlers.
+
+Each handler module is imported in a fresh interpreter started with
+`python -X importtime`, from the handler's own directory as Lambda does, and
+the import log is summed per top-level package (`pandas`, `sqlalchemy`,
+`mysql`, ...) from each module's self time, so the cost of a package includes
+everything it loads in turn. Modules the bare interpreter imports at startup
+are left out. Each handler is run `--repeat` times and the median is reported.
+
+    python scripts/import_bench.py
+    python scripts/import_bench.py mds_api_service/query_progress_tracker_table.py --repeat 10 --top 5
+
+A handler whose dependencies are not installed is reported with the import
+error instead of timings.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HANDLERS = [
+    'mds_api_service/query_progress_tracker_table.py',
+    'mds_data_sync/mds2mysql/lambda_function.py',
+    'reporter/lambda_handler.py',
+]
+
+
+def parse_importtime(log: str) -> list:
+    """(module, self microseconds, cumulative microseconds) for each line of a -X importtime log."""
+    imports = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def _run(statement: str, cwd: str):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=cwd,
+                          capture_output=True, text=True)
+    return proc, time.perf_counter() - start
+
+
+def bench_handler(path: str, repeat: int = 5, top: int = 10) -> dict:
+    """
+    Import cost of the handler module at `path`.
+
+    Returns:
+        Dict with the handler, `seconds` (median cumulative import time of the
+        module), `process_seconds` (median wall time of the interpreter run,
+        startup included) and `packages`, the `top` packages by median import
+        time in milliseconds; or the handler and `error` if the import failed.
+    """
+    cwd = os.path.dirname(os.path.abspath(path))
+    module = os.path.splitext(os.path.basename(path))[0]
+    baseline = {name for name, _, _ in parse_importtime(_run('pass', cwd)[0].stderr)}
+
+    totals, walls, packages = [], [], {}
+    for _ in range(repeat):
+        proc, wall = _run(f'import {module}', cwd)
+        if proc.returncode != 0:
+            return {'handler': path, 'error': proc.stderr.strip().splitlines()[-1]}
+        imports = parse_importtime(proc.stderr)
+        totals.append(next(cumulative for name, _, cumulative in imports if name == module))
+        walls.append(wall)
+        run = {}
+        for name, self_us, _ in imports:
+            if name not in baseline and name != module:
+                run[name.split('.')[0]] = run.get(name.split('.')[0], 0) + self_us
+        for package, us in run.items():
+            packages.setdefault(package, []).append(us)
+
+    medians = {package: statistics.median(times + [0] * (repeat - len(times))) for package, times in packages.items()}
+    ranked = sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'handler': path,
+        'seconds': round(statistics.median(totals) / 1e6, 3),
+        'process_seconds': round(statistics.median(walls), 3),
+        'packages': {package: round(us / 1e3, 1) for package, us in ranked},
+    }
+
+
+def main(args):
+    logging.basicConfig(level=logging.INFO)
+    results = []
+    for path in args.handlers or [os.path.join(REPO_DIR, handler) for handler in HANDLERS]:
+        result = bench_handler(path, repeat=args.repeat, top=args.top)
+        result['handler'] = os.path.relpath(path, REPO_DIR)
+        if 'error' in result:
+            logger.warning("%s could not be imported: %s", result['handler'], result['error'])
+        else:
+            logger.info("%s imports in %.3fs (%.3fs with interpreter startup)",
+                        result['handler'], result['seconds'], result['process_seconds'])
+            for package, ms in result['packages'].items():
+                logger.info("    %-24s %8.1f ms", package, ms)
+        results.append(result)
+    if args.json:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the import time of each Lambda handler, per package")
+    parser.add_argument('handlers', action="store", nargs="*", help="Handler files to measure (default: every Lambda handler)")
+    parser.add_argument('--repeat', dest="repeat", action="store", type=int, default=5, help="Fresh interpreters per handler")
+    parser.add_argument('--top', dest="top", action="store", type=int, default=10, help="Packages to report per handler")
+    parser.add_argument('--json', dest="json", action="store_true", help="Also print the results as JSON")
+
+    main(parser.parse_args())
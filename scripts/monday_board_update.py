@@ -7,6 +7,7 @@
 ## If running on Google Colab, uncomment the following lines
 # from google.colab import drive
 # drive.mount('/content/drive', force_remount=True)
+import json
 import pandas as pd
 from pathlib import Path
 import numpy as np
@@ -99,6 +100,16 @@ def create_mysql_subset(in_df:pd.DataFrame, extra_fields = ['appl_id'], rename_d
         subset.rename(columns={k:v for k,v in rename_dict.items() if k in in_df.columns}, inplace=True)
         return subset
 
+'''
+Format a progress_tracker investigators_name value as semicolon separated names.
+The column is a JSON list; older exports hold a quoted Python list instead.
+'''
+def format_pi_names(names:str):
+    try:
+        return '; '.join(json.loads(names))
+    except (ValueError, TypeError):
+        return names.translate(str.maketrans(',', ';', "[]\'"))
+
 '''
 Import study lookup table from MySQL database for HEAL.
 This lookup table is the result of the logic to identifying HDPIDs (Unique HEAL Identifiers),
@@ -298,7 +309,7 @@ def fill_in_holes_from_mds(input_dir:Path, mysql_data:pd.DataFrame):
     progress_tracker_data = create_mysql_subset(progress_tracker_data, extra_fields=['hdp_id'], rename_dict=RENAME_DICT_MDS)
 
     progress_tracker_data['PI(s)'] = progress_tracker_data['PI(s)'].fillna('')
-    progress_tracker_data['PI(s)'] = [ k.translate(str.maketrans(',', ';', "[]\'")) for k in  progress_tracker_data['PI(s)']]
+    progress_tracker_data['PI(s)'] = [ format_pi_names(k) for k in  progress_tracker_data['PI(s)']]
 
     progress_tracker_data['key'] = progress_tracker_data['hdp_id']
     progress_tracker_data['study_hdp_id'] = progress_tracker_data['hdp_id']
@@ -336,7 +347,7 @@ def get_ctndata_from_mds(input_dir:Path):
     ctn_fields_platform = create_mysql_subset(ctn_data, extra_fields=['hdp_id'], rename_dict=RENAME_DICT_CTN)
     ## Edit pi name
     ctn_fields_platform['PI(s)'] = ctn_fields_platform['PI(s)'].fillna('')
-    ctn_fields_platform['PI(s)'] = [ k.translate(str.maketrans(',', ';', "[]\'")) for k in  ctn_fields_platform['PI(s)']]
+    ctn_fields_platform['PI(s)'] = [ format_pi_names(k) for k in  ctn_fields_platform['PI(s)']]
     ctn_fields_platform['key'] = ctn_fields_platform['hdp_id']
     ctn_fields_platform['study_hdp_id'] = ctn_fields_platform['hdp_id']
     ctn_fields_platform['Research Network'] = ['CTN']*len(ctn_fields_platform)
@@ -0,0 +1,11 @@
+"""
+The modules under test are loaded the way their Lambdas and scripts load them:
+each directory on sys.path, with the shared modules in common/.
+"""
+import os
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+for directory in ('common', os.path.join('mds_data_sync', 'mds2mysql'), 'mds_api_service', 'scripts'):
+    sys.path.insert(0, os.path.join(REPO_DIR, directory))
@@ -0,0 +1,113 @@
+"""Round trip of the snapshot index and documents, and the progress_tracker snapshot the sync exports."""
+import json
+
+import pytest
+from sqlalchemy import create_engine
+
+import json_snapshot
+from json_snapshot import Snapshot, index_key, write_snapshot
+from progress_tracker_load import export_snapshot
+from progress_tracker_schema import Column
+
+
+@pytest.fixture
+def snapshot_file(tmp_path):
+    return str(tmp_path / 'test.snap')
+
+
+def test_round_trip(snapshot_file):
+    documents = [json.dumps({'hdp_id': f"HDP{n}", 'name': f"Étude {n}"}, ensure_ascii=False) for n in range(3)]
+    keys = {index_key('appl_id_key', '111'): [0, 2], index_key('hdp_id_key', 'HDP1'): [1]}
+    write_snapshot(snapshot_file, documents, keys, version='abc123')
+
+    snapshot = Snapshot(snapshot_file)
+    try:
+        assert snapshot.size == 3
+        assert snapshot.version == 'abc123'
+        assert snapshot.numbers(index_key('appl_id_key', '111')) == [0, 2]
+        # Keys are lowercased, as MySQL compares the lookup columns
+        assert snapshot.numbers(index_key('hdp_id_key', 'hdp1')) == [1]
+        assert snapshot.numbers(index_key('hdp_id_key', '111')) == []
+        assert snapshot.numbers('missing') == []
+        assert [bytes(snapshot.document(n)).decode('utf-8') for n in range(3)] == documents
+    finally:
+        snapshot.close()
+
+
+def test_colliding_hashes(snapshot_file, monkeypatch):
+    # Every key in the same slot: lookups probe past the other keys to the right one, or to an empty slot
+    monkeypatch.setattr(json_snapshot, '_hash', lambda key: 7)
+    keys = {f"key{n}": [n] for n in range(20)}
+    write_snapshot(snapshot_file, [str(n) for n in range(20)], keys)
+
+    snapshot = Snapshot(snapshot_file)
+    try:
+        assert [snapshot.numbers(key) for key in keys] == [[n] for n in range(20)]
+        assert snapshot.numbers('key20') == []
+        assert snapshot.version is None
+    finally:
+        snapshot.close()
+
+
+def test_many_keys(snapshot_file):
+    keys = {index_key('appl_id_key', str(n)): [n, n + 1] for n in range(5000)}
+    write_snapshot(snapshot_file, ['{}'] * 5001, keys)
+
+    snapshot = Snapshot(snapshot_file)
+    try:
+        assert all(snapshot.numbers(key) == numbers for key, numbers in keys.items())
+        assert snapshot.numbers(index_key('appl_id_key', '5000')) == []
+    finally:
+        snapshot.close()
+
+
+def test_empty(snapshot_file):
+    write_snapshot(snapshot_file, [], {})
+
+    snapshot = Snapshot(snapshot_file)
+    try:
+        assert snapshot.size == 0
+        assert snapshot.numbers(index_key('hdp_id_key', 'HDP1')) == []
+    finally:
+        snapshot.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.snap'
+    path.write_bytes(b'\0' * 64)
+
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+def test_export_writes_only_public_columns(tmp_path, snapshot_file):
+    schema = [
+        Column('hdp_id', 'text', 16, None, None, 'PK', None),
+        Column('appl_id', 'text', 16, None, None, None, None),
+        Column('investigators_name', 'json', None, None, None, None, None),
+        Column('row_hash', 'text', 32, None, None, None, None),
+        Column('date_last_mds_update', 'datetime', None, None, None, None, None),
+        Column('hdp_id_key', 'text', 16, None, None, 'INDEX', "REPLACE(hdp_id, '-', '')"),
+        Column('appl_id_key', 'text', 16, None, None, 'INDEX', "REPLACE(appl_id, '-', '')"),
+    ]
+    engine = create_engine(f"sqlite:///{tmp_path / 'progress_tracker.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE progress_tracker (hdp_id, appl_id, investigators_name, row_hash, "
+                             "date_last_mds_update, hdp_id_key, appl_id_key)")
+        conn.exec_driver_sql("INSERT INTO progress_tracker VALUES "
+                             "('HDP-2', '1-11', '[\"B\"]', 'h2', '2024-05-01 12:00:00', 'HDP2', '111'), "
+                             "('HDP-1', '1-11', NULL, 'h1', '2024-05-01 12:00:00', 'HDP1', '111')")
+
+    assert export_snapshot(engine, 'progress_tracker', snapshot_file, schema) == {'rows': 2, 'keys': 3}
+    snapshot = Snapshot(snapshot_file)
+    try:
+        # In primary key order, with row_hash and the lookup keys left out and JSON columns decoded
+        assert [json.loads(snapshot.document(n)) for n in range(2)] == [
+            {'hdp_id': 'HDP-1', 'appl_id': '1-11', 'investigators_name': None, 'date_last_mds_update': '2024-05-01 12:00:00'},
+            {'hdp_id': 'HDP-2', 'appl_id': '1-11', 'investigators_name': ['B'], 'date_last_mds_update': '2024-05-01 12:00:00'},
+        ]
+        assert snapshot.numbers(index_key('appl_id_key', '111')) == [0, 1]
+        assert snapshot.numbers(index_key('hdp_id_key', 'hdp2')) == [1]
+        assert snapshot.version is not None
+    finally:
+        snapshot.close()
@@ -0,0 +1,43 @@
+"""The sync Lambda's {"action": "rollback"} event."""
+import json
+
+import pytest
+
+import lambda_function
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    calls = []
+    monkeypatch.setattr(lambda_function, 'load_dotenv', lambda: None)
+    monkeypatch.setenv('TABLE_NAME', 'progress_tracker')
+    monkeypatch.setenv('PROGRESS_TRACKER_SNAPSHOT_PATH', '/tmp/progress_tracker.snap')
+    monkeypatch.setattr(lambda_function, 'get_engine', lambda: 'engine')
+    monkeypatch.setattr(lambda_function, 'mds_data_prep', lambda local: calls.append('prep'))
+    monkeypatch.setattr(lambda_function, 'sync_progress_tracker', lambda *args: calls.append('sync'))
+    monkeypatch.setattr(lambda_function, 'export_snapshot',
+                        lambda engine, table_name, path: calls.append(('snapshot', table_name, path)))
+    return calls
+
+
+def test_rollback_event_undoes_the_last_run(handler, monkeypatch):
+    monkeypatch.setattr(lambda_function, 'rollback_progress_tracker',
+                        lambda engine, table_name: handler.append(('rollback', table_name)) or 'sync')
+
+    response = lambda_function.lambda_handler({'action': 'rollback'}, None)
+
+    assert response == {'statusCode': 200, 'result': json.dumps({'undone': 'sync'})}
+    # Nothing is fetched or synced, and the snapshot is written again from the restored rows
+    assert handler == [('rollback', 'progress_tracker'), ('snapshot', 'progress_tracker', '/tmp/progress_tracker.snap')]
+
+
+def test_nothing_to_roll_back(handler, monkeypatch):
+    def rollback(engine, table_name):
+        raise ValueError("No previous version of progress_tracker to roll back to")
+    monkeypatch.setattr(lambda_function, 'rollback_progress_tracker', rollback)
+
+    response = lambda_function.lambda_handler({'action': 'rollback'}, None)
+
+    assert response['statusCode'] == 500
+    assert json.loads(response['result']) == {'error': "No previous version of progress_tracker to roll back to"}
+    assert handler == []
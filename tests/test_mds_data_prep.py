@@ -0,0 +1,44 @@
+"""parse_mds_response on a small MDS sample, against the frame checked in next to it."""
+import datetime
+import io
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import mds_data_prep
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class SyncTime(datetime.datetime):
+    """The sync's clock, stopped so date_last_mds_update is the same every run."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 5, 1, 12, 0, 0)
+
+
+def as_text(csv):
+    # Every cell as written to CSV, so a changed value or dtype (2 against 2.0) shows in its column
+    return pd.read_csv(io.StringIO(csv), dtype=str, keep_default_na=False)
+
+
+@pytest.fixture
+def sample():
+    with open(os.path.join(FIXTURES, 'mds_sample.json')) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_parse_matches_the_expected_frame(monkeypatch, sample, streamed):
+    monkeypatch.setattr(mds_data_prep, 'datetime', SyncTime)
+    # get_mds_response hands over either the whole response or (guid, record) pairs as they arrive
+    response = iter(sample.items()) if streamed else sample
+
+    df = mds_data_prep.parse_mds_response(response)
+
+    with open(os.path.join(FIXTURES, 'mds_sample_expected.csv'), encoding='utf-8', newline='') as f:
+        expected = f.read()
+    pd.testing.assert_frame_equal(as_text(df.to_csv(index=False)), as_text(expected))
@@ -0,0 +1,31 @@
+"""PI(s) on the Monday board, formatted from the progress_tracker export's investigators_name."""
+import json
+
+import pytest
+
+pytest.importorskip('click')
+from monday_board_update import format_pi_names
+
+
+def test_names_keep_their_apostrophes_and_commas():
+    names = json.dumps(["O'Brien, Pat", "Smith, J", "D'Angelo"])
+
+    # Each name is one entry of the JSON list, so a comma inside a name no longer splits it
+    assert format_pi_names(names) == "O'Brien, Pat; Smith, J; D'Angelo"
+
+
+def test_unicode_names():
+    assert format_pi_names(json.dumps(["Müller, Ä"], ensure_ascii=False)) == "Müller, Ä"
+    assert format_pi_names(json.dumps(["Müller, Ä"])) == "Müller, Ä"
+
+
+def test_empty_values():
+    assert format_pi_names('[]') == ''
+    # Missing PI(s) are filled with '' before formatting
+    assert format_pi_names('') == ''
+
+
+def test_older_exports_hold_a_quoted_python_list():
+    # Brackets and quotes are stripped and commas become separators, as before the column was JSON
+    assert format_pi_names("['Smith J', 'Jones B']") == 'Smith J; Jones B'
+    assert format_pi_names("['Smith, J']") == 'Smith; J'
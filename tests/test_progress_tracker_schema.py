@@ -0,0 +1,46 @@
+"""apply_schema's handling of MDS values that do not fit the declared columns."""
+import logging
+
+import pandas as pd
+
+from progress_tracker_schema import Column, apply_schema, load_schema
+
+SCHEMA = [
+    Column('hdp_id', 'text', 16, None, None, 'PK', None),
+    Column('award_type', 'text', 2, None, '0', None, None),
+    Column('project_title', 'text', None, None, '0', None, None),
+    Column('row_hash', 'text', 32, None, None, None, None),
+]
+
+
+def test_overlong_values_are_truncated(caplog):
+    df = pd.DataFrame({'hdp_id': ['HDP1', 'HDP2'], 'award_type': ['5', '4N-extra'], 'project_title': ['x' * 300, None]})
+    with caplog.at_level(logging.WARNING, logger='progress_tracker_schema'):
+        out = apply_schema(df, SCHEMA)
+
+    assert out['award_type'].tolist() == ['5', '4N']
+    # TEXT columns have no bound
+    assert out['project_title'].tolist() == ['x' * 300, '0']
+    assert "Truncated 1 values of award_type to VARCHAR(2) for ['HDP2']" in caplog.text
+
+
+def test_repeated_keys_keep_the_first_row(caplog):
+    df = pd.DataFrame({'hdp_id': ['HDP1', 'HDP2', 'HDP1'], 'award_type': ['1', '2', '3']})
+    with caplog.at_level(logging.WARNING, logger='progress_tracker_schema'):
+        out = apply_schema(df, SCHEMA)
+
+    assert out['hdp_id'].tolist() == ['HDP1', 'HDP2']
+    assert out['award_type'].tolist() == ['1', '2']
+    assert out['row_hash'].notna().all()
+    assert "Dropped 1 rows repeating a hdp_id: ['HDP1']" in caplog.text
+
+
+def test_declared_bounds_fit_long_mds_values():
+    schema = {col.name: col for col in load_schema()}
+    df = pd.DataFrame({'hdp_id': ['HDP00001'], 'appl_id': ['CTN-0100-XX'], 'award_type': ['4N'],
+                       'project_title': ['A' * 400], 'Registering user': ['user@example.org' * 20]})
+    out = apply_schema(df, list(schema.values()))
+
+    assert out.loc[0, 'appl_id'] == 'CTN-0100-XX'
+    assert len(out.loc[0, 'project_title']) == 400
+    assert schema['project_title'].length is None and schema['appl_id_key'].length == schema['appl_id'].length
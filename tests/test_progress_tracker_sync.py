@@ -0,0 +1,196 @@
+"""sync_progress_tracker's classification of rows as inserted, updated, deleted or unchanged, and its rollback."""
+import contextlib
+import datetime
+
+import pandas as pd
+import pytest
+
+from sqlalchemy import create_engine, event
+
+import progress_tracker_load
+from progress_tracker_load import sync_progress_tracker
+from progress_tracker_schema import Column, table_definition
+
+SCHEMA = [
+    Column('hdp_id', 'text', 16, None, None, 'PK', None),
+    Column('study_name', 'text', None, None, None, None, None),
+    Column('row_hash', 'text', 32, None, None, None, None),
+    Column('date_last_mds_update', 'datetime', None, None, None, None, None),
+    Column('hdp_id_key', 'text', 16, None, None, 'INDEX', "REPLACE(hdp_id, '-', '')"),
+]
+SYNCED_AT = pd.Timestamp('2024-05-01 12:00:00')
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection:
+    def __init__(self, statements, latest):
+        self.statements = statements
+        self.latest = latest
+
+    def exec_driver_sql(self, statement, params=None):
+        self.statements.append((statement, params))
+        # The sync reads the next sync_run and the latest date_last_mds_update
+        return FakeResult(1 if 'sync_run' in statement else self.latest)
+
+
+class FakeEngine:
+    """Records the statements of each transaction; `latest` is the table's MAX(date_last_mds_update)."""
+
+    def __init__(self, latest=None):
+        self.transactions = []
+        self.latest = latest
+
+    @contextlib.contextmanager
+    def begin(self):
+        self.transactions.append([])
+        yield FakeConnection(self.transactions[-1], self.latest)
+
+    def statements(self, prefix):
+        return [(statement, params) for transaction in self.transactions
+                for statement, params in transaction if statement.startswith(prefix)]
+
+
+def frame(rows):
+    return pd.DataFrame({
+        'hdp_id': [hdp_id for hdp_id, _ in rows],
+        'study_name': [f"Study {hdp_id}" for hdp_id, _ in rows],
+        'row_hash': [row_hash for _, row_hash in rows],
+        'date_last_mds_update': [SYNCED_AT] * len(rows),
+    })
+
+
+@pytest.fixture
+def sync(monkeypatch):
+    """Run a sync of a frame against a table holding `current` (hdp_id -> row_hash)."""
+    def run(rows, current, latest=SYNCED_AT.to_pydatetime()):
+        engine = FakeEngine(latest)
+        monkeypatch.setattr(progress_tracker_load, 'create_version_table', lambda conn: None)
+        monkeypatch.setattr(progress_tracker_load, 'create_changes_table', lambda conn, table_name, schema: None)
+        monkeypatch.setattr(progress_tracker_load, 'current_hashes',
+                            lambda conn, table_name, schema: pd.Series(current, dtype=object))
+        stats = sync_progress_tracker(engine, frame(rows), 'progress_tracker', schema=SCHEMA, full=False)
+        return stats, engine
+    return run
+
+
+def test_classification(sync):
+    stats, engine = sync(
+        [('HDP1', 'same'), ('HDP2', 'new hash'), ('HDP4', 'added')],
+        {'HDP1': 'same', 'HDP2': 'old hash', 'HDP3': 'gone'},
+    )
+
+    assert {name: stats[name] for name in ('inserted', 'updated', 'deleted', 'unchanged')} == \
+        {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1}
+    upserts = engine.statements('INSERT INTO `progress_tracker` (')
+    assert len(upserts) == 1
+    assert [row[0] for row in upserts[0][1]] == ['HDP2', 'HDP4']
+    assert engine.statements('DELETE FROM `progress_tracker`') == \
+        [("DELETE FROM `progress_tracker` WHERE `hdp_id` IN (%s)", ('HDP3',))]
+
+
+def test_unchanged_rows_are_not_written(sync):
+    last_change = datetime.datetime(2024, 4, 1, 12, 0)
+    stats, engine = sync([('HDP1', 'a'), ('HDP2', 'b')], {'HDP1': 'a', 'HDP2': 'b'}, latest=last_change)
+
+    assert stats['unchanged'] == 2 and stats['rows'] == 0
+    assert engine.statements('INSERT INTO `progress_tracker` (') == []
+    assert engine.statements('DELETE') == []
+    assert engine.statements('UPDATE') == []
+    # The version follows the rows' own sync times, so it is unchanged; the run's time is recorded next to it
+    (_, params), = engine.statements('INSERT INTO `table_versions`')
+    assert params == ('progress_tracker', progress_tracker_load.table_version(['a', 'b'], last_change),
+                      progress_tracker_load.schema_version(SCHEMA), SYNCED_AT.to_pydatetime())
+    # Nothing changed, so nothing is saved for a rollback
+    assert engine.statements('INSERT INTO `progress_tracker_changes`') == []
+
+
+def test_changes_save_only_the_changed_rows(sync):
+    _, engine = sync([('HDP1', 'same'), ('HDP2', 'changed'), ('HDP4', 'added')],
+                     {'HDP1': 'same', 'HDP2': 'a', 'HDP3': 'gone'})
+
+    # The pre-images are saved in the sync's own transaction, before its writes, and no table is copied
+    transaction = engine.transactions[-1]
+    assert [statement.split(' (')[0] for statement, _ in transaction[:4]] == [
+        'SELECT COALESCE(MAX(sync_run), 0) + 1 FROM `progress_tracker_changes`',
+        'INSERT INTO `progress_tracker_changes`',
+        'INSERT INTO `progress_tracker_changes`',
+        'INSERT INTO `progress_tracker`',
+    ]
+    (copy, copy_params), (inserted, inserted_params) = engine.statements('INSERT INTO `progress_tracker_changes`')
+    assert 'SELECT %s, 1, `hdp_id`, `study_name`, `row_hash`, `date_last_mds_update` FROM `progress_tracker`' in copy
+    assert copy_params == (1, 'HDP2', 'HDP3')
+    assert inserted_params == [(1, 'HDP4')]
+    assert engine.statements('CREATE TABLE') == [] and engine.statements('RENAME') == []
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'mds.db'}")
+    # The loader writes %s parameters, as PyMySQL takes them
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, params, context, executemany: (statement.replace('%s', '?'), params),
+                 retval=True)
+    return engine
+
+
+def test_rollback_restores_the_pre_images(sqlite_engine, monkeypatch):
+    versions = []
+    # table_versions is written with MySQL's ON DUPLICATE KEY UPDATE
+    monkeypatch.setattr(progress_tracker_load, 'write_version',
+                        lambda conn, table_name, version, schema_hash=None, synced_at=None: versions.append(schema_hash))
+    monkeypatch.setattr(progress_tracker_load, 'stored_schema_version', lambda conn, table_name: 'dd hash')
+
+    def rows():
+        with sqlite_engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT * FROM progress_tracker ORDER BY hdp_id").fetchall()
+
+    with sqlite_engine.begin() as conn:
+        table_definition('progress_tracker', SCHEMA).create(conn)
+        progress_tracker_load.create_changes_table(conn, 'progress_tracker', SCHEMA)
+        conn.exec_driver_sql("INSERT INTO progress_tracker (hdp_id, study_name, row_hash, date_last_mds_update) VALUES "
+                             "('HDP-1', 'Old', 'a', '2024-04-01 00:00:00'), ('HDP-2', 'Gone', 'b', '2024-04-01 00:00:00')")
+    before = rows()
+
+    # A sync that updates HDP-1, deletes HDP-2 and inserts HDP-3
+    with sqlite_engine.begin() as conn:
+        run = progress_tracker_load.save_pre_images(conn, 'progress_tracker', 'hdp_id', ['HDP-1', 'HDP-2'], ['HDP-3'], SCHEMA)
+        conn.exec_driver_sql("UPDATE progress_tracker SET study_name = 'New', row_hash = 'c' WHERE hdp_id = 'HDP-1'")
+        conn.exec_driver_sql("DELETE FROM progress_tracker WHERE hdp_id = 'HDP-2'")
+        conn.exec_driver_sql("INSERT INTO progress_tracker (hdp_id, study_name, row_hash) VALUES ('HDP-3', 'Added', 'd')")
+    assert run == 1
+
+    assert progress_tracker_load.rollback_progress_tracker(sqlite_engine, 'progress_tracker', SCHEMA) == 'sync'
+    assert rows() == before
+    # The definition did not change, so the next run can sync rows again
+    assert versions == ['dd hash']
+    # The sync's pre-images are used up; with no previous table there is nothing further to undo
+    with pytest.raises(ValueError):
+        progress_tracker_load.rollback_progress_tracker(sqlite_engine, 'progress_tracker', SCHEMA)
+
+
+def test_reload_when_table_does_not_match(monkeypatch):
+    engine = FakeEngine()
+    reloads = []
+    monkeypatch.setattr(progress_tracker_load, 'create_version_table', lambda conn: None)
+    monkeypatch.setattr(progress_tracker_load, 'current_hashes', lambda conn, table_name, schema: None)
+    monkeypatch.setattr(progress_tracker_load, 'load_progress_tracker',
+                        lambda engine, df, table_name, **kwargs: reloads.append(len(df)) or {'method': 'insert'})
+    stats = sync_progress_tracker(engine, frame([('HDP1', 'a'), ('HDP2', 'b')]), 'progress_tracker',
+                                  schema=SCHEMA, full=False)
+
+    assert reloads == [2]
+    assert stats['inserted'] == 2 and stats['unchanged'] == 0
+
+
+def test_schema_version_follows_column_types():
+    retyped = [col._replace(kind='decimal', length=12, scale=2) if col.name == 'study_name' else col for col in SCHEMA]
+
+    assert progress_tracker_load.schema_version(SCHEMA) == progress_tracker_load.schema_version(list(SCHEMA))
+    assert progress_tracker_load.schema_version(retyped) != progress_tracker_load.schema_version(SCHEMA)
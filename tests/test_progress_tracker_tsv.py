@@ -0,0 +1,71 @@
+"""write_tsv must produce what LOAD DATA LOCAL INFILE reads back, with its default options, as the frame."""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from progress_tracker_load import write_tsv
+
+_UNESCAPE = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r', '0': '\0', 'N': None}
+
+
+def read_tsv(path):
+    """Read a file as LOAD DATA does with FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'."""
+    with open(path, encoding='utf-8', newline='') as f:
+        text = f.read()
+    rows, row, field, i = [], [], '', 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            escaped = text[i + 1]
+            if escaped == 'N' and field == '' and text[i + 2:i + 3] in ('\t', '\n'):
+                field = None
+            else:
+                field += _UNESCAPE[escaped]
+            i += 2
+            continue
+        if char in ('\t', '\n'):
+            row.append(field)
+            field = ''
+            if char == '\n':
+                rows.append(row)
+                row = []
+        else:
+            field += char
+        i += 1
+    return rows
+
+
+def test_round_trip(tmp_path):
+    df = pd.DataFrame({
+        'hdp_id': ['HDP1', 'HDP2', 'HDP3'],
+        'study_name': ['tab\there', 'line\nbreak\r\n', 'back\\slash \\N and nul\0'],
+        'investigators_name': ['["Ä. Smith", "B. Jones"]', None, '[]'],
+        'award_amount': [12.5, np.nan, 0],
+        'date_last_mds_update': pd.to_datetime(['2024-01-02 03:04:05', None, '2024-12-31 00:00:00']),
+    })
+    path = tmp_path / 'rows.tsv'
+    write_tsv(df, path)
+
+    assert read_tsv(path) == [
+        ['HDP1', 'tab\there', '["Ä. Smith", "B. Jones"]', '12.5', '2024-01-02 03:04:05'],
+        ['HDP2', 'line\nbreak\r\n', None, None, None],
+        ['HDP3', 'back\\slash \\N and nul\0', '[]', '0.0', '2024-12-31 00:00:00'],
+    ]
+
+
+def test_one_line_per_row(tmp_path):
+    df = pd.DataFrame({'hdp_id': ['HDP1', 'HDP2'], 'study_name': ['a\nb', 'c\td']})
+    path = tmp_path / 'rows.tsv'
+    write_tsv(df, path)
+
+    lines = path.read_text(encoding='utf-8').split('\n')
+    assert lines == ['HDP1\ta\\nb', 'HDP2\tc\\td', '']
+
+
+def test_string_n_is_not_null(tmp_path):
+    df = pd.DataFrame({'study_name': ['N', '\\N', None], 'completed': [datetime.date(2024, 1, 2), None, None]})
+    path = tmp_path / 'rows.tsv'
+    write_tsv(df, path)
+
+    assert read_tsv(path) == [['N', '2024-01-02'], ['\\N', None], [None, None]]
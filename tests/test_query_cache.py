@@ -0,0 +1,117 @@
+"""The query API's cache is emptied when the sync writes a new version of the table."""
+import sqlite3
+import types
+from collections import OrderedDict
+
+import pytest
+
+import query_progress_tracker_table as api
+
+
+class SnapshotCursor:
+    """mysql.connector-style cursor over SQLite."""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.db.cursor()
+        self.description = None
+
+    def execute(self, query, params=()):
+        if not self._connection.autocommit and not self._connection.db.in_transaction:
+            # Like InnoDB, the first read without autocommit opens a transaction whose
+            # snapshot every later read sees until it is committed or rolled back
+            self._connection.db.execute("BEGIN")
+        self._cursor.execute(query.replace('%s', '?'), params)
+        self.description = self._cursor.description
+        if self._connection.autocommit and self._connection.db.in_transaction:
+            self._connection.db.execute("COMMIT")
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class SnapshotConnection:
+    """Reader connection with REPEATABLE READ semantics; SQLite in WAL mode keeps a snapshot per read transaction."""
+
+    def __init__(self, path, autocommit=False, **kwargs):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.autocommit = autocommit
+
+    def cursor(self):
+        return SnapshotCursor(self)
+
+    def ping(self, reconnect=False):
+        pass
+
+    def commit(self):
+        if self.db.in_transaction:
+            self.db.execute("COMMIT")
+
+    def rollback(self):
+        if self.db.in_transaction:
+            self.db.execute("ROLLBACK")
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'mds.db')
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE progress_tracker (hdp_id, study_name, hdp_id_key, appl_id_key, project_num_key)")
+    db.execute("INSERT INTO progress_tracker VALUES ('HDP1', 'Old name', 'HDP1', '111', 'P1')")
+    db.execute("CREATE TABLE table_versions (table_name, version, updated_at, schema_version)")
+    db.execute("INSERT INTO table_versions VALUES ('progress_tracker', 'v1', '2024-05-01', NULL)")
+    yield path, db
+    db.close()
+
+
+@pytest.fixture
+def connections(monkeypatch, database):
+    path, _ = database
+    opened = []
+
+    def connect(**kwargs):
+        opened.append(kwargs)
+        return SnapshotConnection(path, **kwargs)
+
+    fake = types.SimpleNamespace(connect=connect, Error=sqlite3.Error, FieldType=types.SimpleNamespace(JSON=245))
+    monkeypatch.setattr(api, 'connector', lambda: fake)
+    monkeypatch.setattr(api, '_configured', True)
+    monkeypatch.setattr(api, 'table_name', 'progress_tracker')
+    monkeypatch.setattr(api, 'public_fields', ['hdp_id', 'study_name'])
+    monkeypatch.setattr(api, 'snapshot_path', None)
+    monkeypatch.setattr(api, 'cache_ttl', 0)
+    monkeypatch.setattr(api, '_connection', None)
+    monkeypatch.setattr(api, '_cache', OrderedDict())
+    monkeypatch.setattr(api, '_cache_version', None)
+    monkeypatch.setattr(api, '_version_checked_at', None)
+    return opened
+
+
+def test_new_version_empties_the_cache(database, connections):
+    _, writer = database
+    assert api.lookup([('hdp_id_key', 'HDP1')])[('hdp_id_key', 'HDP1')][0]['study_name'] == 'Old name'
+    assert api._cache_version == 'v1'
+
+    # The sync commits new rows and a new version stamp while the container keeps its connection
+    writer.execute("BEGIN")
+    writer.execute("UPDATE progress_tracker SET study_name = 'New name'")
+    writer.execute("UPDATE table_versions SET version = 'v2'")
+    writer.execute("COMMIT")
+
+    assert api.lookup([('hdp_id_key', 'HDP1')])[('hdp_id_key', 'HDP1')][0]['study_name'] == 'New name'
+    assert api._cache_version == 'v2'
+    assert len(connections) == 1 and connections[0]['autocommit'] is True
+
+
+def test_reads_leave_no_transaction_open(database, connections):
+    api.lookup([('appl_id_key', '111')])
+
+    # An open transaction would hold a metadata lock on the table and block the sync's RENAME TABLE
+    assert not api._connection.db.in_transaction
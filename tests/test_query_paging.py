@@ -0,0 +1,186 @@
+"""limit/cursor paging of the query API, from the database and from the snapshot."""
+import json
+import sqlite3
+
+import pytest
+
+import query_progress_tracker_table as api
+from json_snapshot import index_key, write_snapshot
+
+PUBLIC_FIELDS = ['hdp_id', 'appl_id', 'project_num', 'study_name']
+ROWS = [
+    # hdp_id, appl_id, project_num
+    ('HDP1', '111', 'P-1'),
+    ('HDP2', '111', 'P-2'),
+    ('HDP3', '222', 'P-1'),
+    ('HDP4', '111', 'P-3'),
+    ('HDP5', '111', 'P-1'),
+]
+
+
+class SqliteCursor:
+    """DB-API cursor with mysql.connector's %s parameters, over SQLite."""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.db.cursor()
+        self.description = None
+
+    def execute(self, query, params=()):
+        self._connection.queries.append(query)
+        self._cursor.execute(query.replace('%s', '?'), params)
+        self.description = self._cursor.description
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class SqliteConnection:
+    """Records the queries it runs."""
+
+    def __init__(self, db):
+        self.db = db
+        self.queries = []
+
+    def cursor(self):
+        return SqliteCursor(self)
+
+
+@pytest.fixture
+def connection():
+    db = sqlite3.connect(':memory:')
+    db.execute("CREATE TABLE progress_tracker (hdp_id, appl_id, project_num, study_name, row_hash, "
+               "hdp_id_key, appl_id_key, project_num_key)")
+    db.executemany("INSERT INTO progress_tracker VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                   [(hdp_id, appl_id, project_num, f"Study {hdp_id}", 'hash', hdp_id, appl_id, project_num.replace('-', ''))
+                    for hdp_id, appl_id, project_num in ROWS])
+    return SqliteConnection(db)
+
+
+@pytest.fixture(params=['database', 'snapshot'])
+def backend(request, monkeypatch, tmp_path, connection):
+    """The API configured to answer from the database or from a snapshot of the same rows."""
+    monkeypatch.setattr(api, '_configured', True)
+    monkeypatch.setattr(api, 'table_name', 'progress_tracker')
+    monkeypatch.setattr(api, 'public_fields', PUBLIC_FIELDS)
+    monkeypatch.setattr(api, '_snapshot', None)
+    monkeypatch.setattr(api, '_snapshot_stat', None)
+    monkeypatch.setattr(api, 'get_connection', lambda: connection)
+    monkeypatch.setattr(api, 'snapshot_path', None)
+    if request.param == 'snapshot':
+        path = str(tmp_path / 'progress_tracker.snap')
+        documents = [json.dumps({'hdp_id': hdp_id, 'appl_id': appl_id, 'project_num': project_num,
+                                 'study_name': f"Study {hdp_id}"}) for hdp_id, appl_id, project_num in ROWS]
+        keys = {}
+        for number, (hdp_id, appl_id, project_num) in enumerate(ROWS):
+            for column, value in (('hdp_id_key', hdp_id), ('appl_id_key', appl_id),
+                                  ('project_num_key', project_num.replace('-', ''))):
+                keys.setdefault(index_key(column, value), []).append(number)
+        write_snapshot(path, documents, keys, version='v1')
+        monkeypatch.setattr(api, 'snapshot_path', path)
+    yield request.param
+    if api._snapshot is not None:
+        api._snapshot.close()
+
+
+def call(**params):
+    return api.lambda_handler({'queryStringParameters': params}, None)
+
+
+def pages(**params):
+    """Every page of a lookup, following X-Next-Cursor."""
+    result = []
+    cursor = params.pop('cursor', None)
+    while True:
+        response = call(**params, **({'cursor': cursor} if cursor else {}))
+        result.append([row['hdp_id'] for row in json.loads(response['body'])])
+        cursor = response['headers'].get('X-Next-Cursor')
+        if cursor is None:
+            return result
+
+
+def test_pages_follow_hdp_id_order(backend):
+    assert pages(appl_id='111', limit='2') == [['HDP1', 'HDP2'], ['HDP4', 'HDP5']]
+    assert pages(appl_id='111', limit='3') == [['HDP1', 'HDP2', 'HDP4'], ['HDP5']]
+    assert pages(appl_id='111', limit='10') == [['HDP1', 'HDP2', 'HDP4', 'HDP5']]
+
+
+def test_rows_matching_several_ids_come_once(backend):
+    # HDP1 and HDP5 match both ids
+    assert pages(appl_id='111', proj_num='P1', limit='2') == [['HDP1', 'HDP2'], ['HDP3', 'HDP4'], ['HDP5']]
+
+
+def test_cursor_without_limit(backend):
+    assert pages(appl_id='111', cursor='HDP2') == [['HDP4', 'HDP5']]
+    assert pages(appl_id='111', cursor='HDP5') == [[]]
+
+
+def test_paged_fields_and_format(backend):
+    response = call(proj_num='P-1', limit='1', fields='study_name', format='csv')
+
+    assert response['body'] == 'study_name\r\nStudy HDP1\r\n'
+    assert response['headers']['X-Next-Cursor'] == 'HDP1'
+
+
+def test_paging_is_done_in_sql(backend, connection):
+    call(appl_id='111', limit='2', cursor='HDP1')
+
+    if backend == 'database':
+        assert len(connection.queries) == 1
+        assert connection.queries[0].endswith("AND hdp_id > %s ORDER BY hdp_id LIMIT %s;")
+    else:
+        assert connection.queries == []
+
+
+def test_batch_requests_reject_paging(backend):
+    for options in ({'limit': 1}, {'cursor': 'HDP1'}):
+        response = api.lambda_handler({'body': json.dumps({'appl_id': ['111'], **options})}, None)
+        assert json.loads(response['body']).startswith("Execution error: limit and cursor")
+
+
+def test_invalid_limit(backend):
+    assert json.loads(call(appl_id='111', limit='0')['body']) == "Execution error: limit must be a positive integer"
+
+
+def test_build_page_query():
+    query, params = api.build_page_query('progress_tracker', {'appl_id_key': ['111', '222'], 'hdp_id_key': []},
+                                         ['hdp_id', 'study_name'], cursor='HDP1', limit=2)
+
+    assert query == ("SELECT `hdp_id`, `study_name` FROM progress_tracker WHERE (appl_id_key IN (%s, %s)) "
+                     "AND hdp_id > %s ORDER BY hdp_id LIMIT %s;")
+    # One row more than the page, to tell whether there is a next one
+    assert params == ('111', '222', 'HDP1', 3)
+    assert api.build_page_query('progress_tracker', {}, ['hdp_id']) == \
+        ("SELECT `hdp_id` FROM progress_tracker WHERE 1=0 ORDER BY hdp_id;", ())
+
+
+class CountingSnapshot:
+    """Snapshot of documents in hdp_id order that counts the documents read."""
+
+    def __init__(self, hdp_ids):
+        self.documents = [json.dumps({'hdp_id': hdp_id}).encode('utf-8') for hdp_id in hdp_ids]
+        self.read = 0
+
+    def numbers(self, key):
+        return list(range(len(self.documents)))
+
+    def document(self, number):
+        self.read += 1
+        return self.documents[number]
+
+
+def test_snapshot_cursor_search(monkeypatch):
+    monkeypatch.setattr(api, 'public_fields', ['hdp_id'])
+    snapshot = CountingSnapshot([f"HDP{n:04d}" for n in range(1000)])
+
+    # A cursor between two ids, as after a row was deleted, starts at the next one
+    rows, next_cursor = api.snapshot_page(snapshot, [('hdp_id_key', 'any')], cursor='HDP0500a', limit=2)
+    assert [row['hdp_id'] for row in rows] == ['HDP0501', 'HDP0502'] and next_cursor == 'HDP0502'
+    # Only the documents probed by the binary search and the page are decoded
+    assert snapshot.read <= 12
+
+    assert api.snapshot_page(snapshot, [('hdp_id_key', 'any')], cursor='HDP0999') == ([], None)
+    assert api.snapshot_page(snapshot, [('hdp_id_key', 'any')], cursor='', limit=1)[0] == [{'hdp_id': 'HDP0000'}]